@@ -6,6 +6,8 @@
 __author__ = 'aymgal'
 
 
+from functools import partial
+
 import jax
 import jax.numpy as jnp
 import numpyro
@@ -33,6 +35,13 @@ class NumpyroModel(BaseProbModel):
             self._num_param = num_param
         return self._num_param
 
+    @property
+    def site_transforms(self):
+        if not hasattr(self, '_site_transforms'):
+            # supports that depend on latent or traced values are not precomputed
+            self._site_transforms = numpyro_util.build_site_transforms(self.model, (), {})
+        return self._site_transforms
+
     def log_prob(self, params, constrained=False):
         """returns the logarithm of the data likelihood plus the logarithm of the prior"""
         if constrained is True:
@@ -40,7 +49,8 @@ class NumpyroModel(BaseProbModel):
             log_prob, model_trace = util.log_density(self.model, (), {}, params)
         else:
             # do this for optimisation in unconstrained space
-            log_prob = - numpyro_util.potential_energy(self.model, (), {}, params)
+            log_prob = - numpyro_util.potential_energy(self.model, (), {}, params,
+                                                       site_transforms=self.site_transforms)
         return log_prob
     
     def log_likelihood(self, params):
@@ -70,7 +80,13 @@ class NumpyroModel(BaseProbModel):
         return numpyro.render_model(self.model)
 
     def constrain(self, params):
-        return numpyro_util.constrain_fn(self.model, (), {}, params)
+        return self._transform(params, False)
 
     def unconstrain(self, params):
-        return numpyro_util.unconstrain_fn(self.model, (), {}, params)
+        return self._transform(params, True)
+
+    @partial(jax.jit, static_argnums=(0, 2))
+    def _transform(self, params, invert):
+        # the model is always called without arguments, so the precomputed transforms are reused
+        return numpyro_util.transform_params(self.model, (), {}, params, invert,
+                                             site_transforms=self.site_transforms)
@@ -2,6 +2,8 @@
 # In the future, these may be incorporated within numpyro 
 
 
+import numpy as np
+import jax
 import jax.numpy as jnp
 from functools import partial
 
@@ -9,58 +11,175 @@ import numpyro
 from numpyro import handlers
 from numpyro.distributions import transforms, constraints
 from numpyro.distributions.util import sum_rightmost
+from numpyro.distributions.distribution import MaskedDistribution
 from numpyro.infer import util
 
 
-def unconstrain_reparam(params, site):
-    """added support for numpyro.param sites"""
+def _is_identity_transform(transform):
+    """
+    Returns True if the transform is known to reduce to the identity,
+    in which case it has a vanishing log-determinant of the Jacobian.
+    """
+    if isinstance(transform, transforms.IdentityTransform):
+        return True
+    if isinstance(transform, transforms.IndependentTransform):
+        return _is_identity_transform(transform.base_transform)
+    if isinstance(transform, transforms.ComposeTransform):
+        return all(_is_identity_transform(part) for part in transform.parts)
+    if isinstance(transform, transforms.AffineTransform):
+        try:
+            return bool(np.all(transform.loc == 0) and np.all(transform.scale == 1))
+        except jax.errors.ConcretizationTypeError:
+            # loc or scale are traced so we cannot decide
+            return False
+    return False
+
+def _site_transform(site):
+    """
+    Builds the bijective transform of a sample or param site, and returns it
+    together with the site information needed by `unconstrain_reparam`
+    and the function specialized to the site type that applies the transform.
+    """
+    if site["type"] == "param":
+        constraint = site["kwargs"].get("constraint", constraints.real)
+        with util.helpful_support_errors(site):
+            transform = transforms.biject_to(constraint)
+        return transform, None, _is_identity_transform(transform), _unconstrain_param
+    support = site["fn"].support
+    with util.helpful_support_errors(site):
+        transform = transforms.biject_to(support)
+    is_identity = _is_identity_transform(transform) or support is constraints.real or (
+        isinstance(support, constraints.independent)
+        and support.base_constraint is constraints.real
+    )
+    return transform, len(site["fn"].event_shape), is_identity, _unconstrain_sample
+
+def _is_latent(site):
+    """Returns True for numpyro.param sites and unobserved continuous sample sites."""
+    return site["type"] == "param" or (
+        site["type"] == "sample"
+        and not site["is_observed"]
+        and not site["fn"].support.is_discrete
+    )
+
+def _has_tracer(transform):
+    """Returns True if the transform holds a traced value."""
+    return any(isinstance(leaf, jax.core.Tracer) for leaf in jax.tree_util.tree_leaves(transform))
+
+def _value_dependent_sites(model, model_args, model_kwargs, values):
+    """
+    Returns the names of the latent sites whose support depends on the value of other
+    latent sites, found by tracing the model with abstract values for all latent sites.
+    """
+    dependent = set()
+    def trace_supports(values):
+        substituted_model = handlers.substitute(handlers.seed(model, rng_seed=0), data=values)
+        with jax.ensure_compile_time_eval():
+            model_trace = handlers.trace(substituted_model).get_trace(*model_args, **model_kwargs)
+            for name, site in model_trace.items():
+                if name in values and _has_tracer(_site_transform(site)[0]):
+                    dependent.add(name)
+    try:
+        jax.eval_shape(trace_supports, values)
+    except (jax.errors.ConcretizationTypeError, jax.errors.TracerArrayConversionError,
+            jax.errors.TracerIntegerConversionError):
+        # the model cannot be traced with abstract values, so no support is assumed constant
+        return set(values)
+    return dependent
+
+def build_site_transforms(model, model_args, model_kwargs):
+    """
+    Traces the model once and builds the transforms of all its latent sites,
+    such that they do not need to be rebuilt at each call of `potential_energy`.
+    Sites whose support depends on the value of other latent sites, or on traced values,
+    are mapped to None: their transform is rebuilt from the site at each call.
+
+    :param model: a callable containing NumPyro primitives.
+    :param tuple model_args: args provided to the model.
+    :param dict model_kwargs: kwargs provided to the model.
+    :return: dict of (transform, len_event_shape, is_identity, unconstrain_fn) or None, keyed by site names.
+    """
+    seeded_model = handlers.seed(model, rng_seed=0)
+    # evaluate eagerly the supports computed from constants, such that the transforms
+    # do not hold tracers when this function is called within a jitted function
+    with jax.ensure_compile_time_eval():
+        model_trace = handlers.trace(seeded_model).get_trace(*model_args, **model_kwargs)
+        site_transforms = {}
+        for name, site in model_trace.items():
+            if _is_latent(site):
+                site_transform = _site_transform(site)
+                site_transforms[name] = None if _has_tracer(site_transform[0]) else site_transform
+    values = {name: model_trace[name]["value"] for name, st in site_transforms.items() if st is not None}
+    if values:
+        for name in _value_dependent_sites(model, model_args, model_kwargs, values):
+            site_transforms[name] = None
+    return site_transforms
+
+def _is_masked(site):
+    """Returns True if the site has been masked, e.g. by numpyro.handlers.mask"""
+    if site.get("mask") is not None:
+        return True
+    fn = site["fn"]
+    while fn is not None:
+        if isinstance(fn, MaskedDistribution):
+            return True
+        fn = getattr(fn, "base_dist", None)
+    return False
+
+def _unconstrain_param(p, site, transform, len_event_shape, is_identity, log_dets=None):
+    """transforms the value of a numpyro.param site"""
+    if is_identity:
+        return p
+    return transform(p)
+
+def _unconstrain_sample(p, site, transform, len_event_shape, is_identity, log_dets=None):
+    """
+    transforms the value of a sample site and adds the log-determinant term,
+    either to the list log_dets if provided, or as a factor site; a factor site
+    is always used within scan and for masked sites, as the list bypasses both
+    """
+    # in scan, we might only want to substitute an item at index i, rather than the whole sequence
+    i = site["infer"].get("_scan_current_index", None)
+    if i is not None:
+        event_dim_shift = transform.codomain.event_dim - transform.domain.event_dim
+        expected_unconstrained_dim = len(site["fn"].shape()) - event_dim_shift
+        # check if p has additional time dimension
+        if jnp.ndim(p) > expected_unconstrained_dim:
+            p = p[i]
+
+    # identity transforms do not need to be applied nor
+    # to contribute a (vanishing) log-determinant term
+    if is_identity:
+        return p
+
+    value = transform(p)
+    log_det = transform.log_abs_det_jacobian(p, value)
+    log_det = sum_rightmost(
+        log_det, jnp.ndim(log_det) - jnp.ndim(value) + len_event_shape
+    )
+    if log_dets is None or i is not None or _is_masked(site):
+        numpyro.factor("_{}_log_det".format(site["name"]), log_det)
+    else:
+        if site["scale"] is not None:
+            log_det = site["scale"] * log_det
+        log_dets.append(jnp.sum(log_det))
+    return value
+
+def unconstrain_reparam(params, site_transforms, site, log_dets=None):
+    """
+    added support for numpyro.param sites, for precomputed site transforms,
+    and for accumulating the log-determinant terms into the list log_dets
+    """
     name = site["name"]
     if name in params:
-        p = params[name]
-        
-        if site["type"] == "param":
-            constraint = site["kwargs"].get("constraint", constraints.real)
-            with util.helpful_support_errors(site):
-                transform = transforms.biject_to(constraint)
-            
-            len_event_shape = len(site["kwargs"]["event_dim"])
+        site_transform = site_transforms.get(name)
+        if site_transform is None:
+            site_transform = _site_transform(site)
+        transform, len_event_shape, is_identity, unconstrain = site_transform
+        return unconstrain(params[name], site, transform, len_event_shape, is_identity,
+                           log_dets=log_dets)
 
-        else:
-            support = site["fn"].support
-            with util.helpful_support_errors(site):
-                transform = transforms.biject_to(support)
-            
-            # in scan, we might only want to substitute an item at index i, rather than the whole sequence
-            i = site["infer"].get("_scan_current_index", None)
-            if i is not None:
-                event_dim_shift = transform.codomain.event_dim - t.domain.event_dim
-                expected_unconstrained_dim = len(site["fn"].shape()) - event_dim_shift
-                # check if p has additional time dimension
-                if jnp.ndim(p) > expected_unconstrained_dim:
-                    p = p[i]
-
-            if support is constraints.real or (
-                isinstance(support, constraints.independent)
-                and support.base_constraint is constraints.real
-            ):
-                return p
-
-            len_event_shape = len(site["fn"].event_shape)
-
-        value = transform(p)
-
-        # NB: we add the determinant term only for sampled sites
-        # and only transformed parameter site values above 
-        if site["type"] == "sample":
-            log_det = transform.log_abs_det_jacobian(p, value)
-            log_det = sum_rightmost(
-                log_det, jnp.ndim(log_det) - jnp.ndim(value) + len_event_shape
-            )
-            numpyro.factor("_{}_log_det".format(name), log_det)
-
-        return value
-
-def potential_energy(model, model_args, model_kwargs, params):
+def potential_energy(model, model_args, model_kwargs, params, site_transforms=None):
     """
     (EXPERIMENTAL INTERFACE) Computes potential energy of a model given unconstrained params.
     Under the hood, we will transform these unconstrained parameters to the values
@@ -70,51 +189,87 @@ def potential_energy(model, model_args, model_kwargs, params):
     :param tuple model_args: args provided to the model.
     :param dict model_kwargs: kwargs provided to the model.
     :param dict params: unconstrained parameters of `model`.
+    :param dict site_transforms: transforms precomputed with `build_site_transforms`;
+        if None, the transforms are built on the fly for each site (as for the sites mapped to None).
     :return: potential energy given unconstrained parameters.
     """
+    if site_transforms is None:
+        site_transforms = {}
+    # the log-determinant terms are accumulated in a single list
+    # rather than being registered as individual factor sites
+    log_dets = []
     substituted_model = handlers.substitute(
-        model, substitute_fn=partial(unconstrain_reparam, params)
+        model, substitute_fn=partial(unconstrain_reparam, params, site_transforms, log_dets=log_dets)
     )
     # no param is needed for log_density computation because we already substitute
     log_joint, model_trace = util.log_density(
         substituted_model, model_args, model_kwargs, {}
     )
-    return -log_joint
+    return -(log_joint + sum(log_dets))
 
-def _transform_fn(model, model_args, model_kwargs, params, invert):
+def _traced_transform_fn(model, model_args, model_kwargs, params, invert, site_transforms):
     """
-    Transforms parameter values between constrained <-> unconstrained spaces.
-    It supports numpyro.param sites
+    Transforms parameter values by tracing the model, such that supports that depend
+    on other latent sites are built from the values of these sites.
     """
-    substituted_model = handlers.substitute(model, params)
+    if invert:
+        substituted_model = handlers.substitute(model, data=params)
+    else:
+        substituted_model = handlers.substitute(
+            model, substitute_fn=partial(unconstrain_reparam, params, site_transforms, log_dets=[])
+        )
     model_trace = handlers.trace(substituted_model).get_trace(*model_args, **model_kwargs)
-    values, inv_transforms = {}, {}
-    for k, v in model_trace.items():
-        if v["type"] == "param":
-            values[k] = v["value"]
-            constraint = v["kwargs"].pop("constraint", constraints.real)
-            with util.helpful_support_errors(v):
-                inv_transforms[k] = transforms.biject_to(constraint)
-        elif (
-            v["type"] == "sample"
-            and not v["is_observed"]
-            and not v["fn"].support.is_discrete
-        ):
-            values[k] = v["value"]
-            with util.helpful_support_errors(v):
-                inv_transforms[k] = transforms.biject_to(v["fn"].support)
-    params_const = util.transform_fn(
-        inv_transforms,
-        {k: v for k, v in values.items()},
-        invert=invert,
-    )
-    return params_const
+    values = {}
+    for name, value in params.items():
+        site = model_trace.get(name)
+        if site is None or not _is_latent(site):
+            values[name] = value
+        elif invert:
+            site_transform = site_transforms.get(name)
+            if site_transform is None:
+                site_transform = _site_transform(site)
+            values[name] = site_transform[0].inv(value)
+        else:
+            values[name] = site["value"]
+    return values
+
+def transform_params(model, model_args, model_kwargs, params, invert, site_transforms=None):
+    """
+    Transforms parameter values between constrained <-> unconstrained spaces.
+    It supports numpyro.param sites. If all supports are constant, the precomputed
+    transforms are applied directly, and as they act elementwise params may also hold
+    a batch of samples along their leading axis. Otherwise, the model is traced.
+
+    :param dict site_transforms: transforms precomputed with `build_site_transforms`;
+        if None, they are built from the model.
+    """
+    if site_transforms is None:
+        site_transforms = build_site_transforms(model, model_args, model_kwargs)
+    if all(st is not None for st in site_transforms.values()):
+        inv_transforms = {name: st[0] for name, st in site_transforms.items()}
+        return util.transform_fn(inv_transforms, params, invert=invert)
+    return _traced_transform_fn(model, model_args, model_kwargs, params, invert, site_transforms)
+
+def make_transform_fn(model, model_args, model_kwargs, invert=False):
+    """
+    Returns a jitted function that transforms parameter values from unconstrained
+    to constrained space (or the reverse if invert is True), with the transforms
+    of the model sites built once and bound to it.
+    """
+    site_transforms = build_site_transforms(model, model_args, model_kwargs)
+    return jax.jit(partial(transform_params, model, model_args, model_kwargs,
+                           invert=invert, site_transforms=site_transforms))
+
+def make_constrain_fn(model, model_args, model_kwargs):
+    return make_transform_fn(model, model_args, model_kwargs, invert=False)
+
+def make_unconstrain_fn(model, model_args, model_kwargs):
+    return make_transform_fn(model, model_args, model_kwargs, invert=True)
 
 def unconstrain_fn(model, model_args, model_kwargs, params):
     # TODO: once next numpyro version is out, use newly implemented utilities from the package
-    return _transform_fn(model, model_args, model_kwargs, params, True)
+    return transform_params(model, model_args, model_kwargs, params, True)
 
 def constrain_fn(model, model_args, model_kwargs, params):
     # TODO: once next numpyro version is out, use newly implemented utilities from the package
-    return _transform_fn(model, model_args, model_kwargs, params, False)
-
+    return transform_params(model, model_args, model_kwargs, params, False)
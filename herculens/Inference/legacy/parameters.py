@@ -8,7 +8,7 @@ __author__ = 'aymgal'
 from copy import deepcopy
 import numpy as np
 import jax.numpy as jnp
-from jax import lax, jit
+from jax import jit
 from functools import partial
 
 from herculens.MassModel.Profiles import pixelated as pixelated_lens
@@ -24,6 +24,69 @@ from herculens.Util import model_util
 __all__ = ['Parameters']
 
 
+_LIGHT_PROFILE_CLASSES = {
+    'GAUSSIAN': gaussian.Gaussian,
+    'GAUSSIAN_ELLIPSE': gaussian.GaussianEllipse,
+    'SERSIC': sersic.Sersic,
+    'SERSIC_ELLIPSE': sersic.SersicElliptic,
+    'UNIFORM': uniform.Uniform,
+    'PIXELATED': pixelated_light.Pixelated,
+    'SHAPELETS': shapelets.Shapelets,
+}
+
+_MASS_PROFILE_CLASSES = {
+    'GAUSSIAN': gaussian_potential.Gaussian,
+    'EPL': epl.EPL,
+    'SIE': sie.SIE,
+    'SIS': sis.SIS,
+    'NIE': nie.NIE,
+    'POINT_MASS': point_mass.PointMass,
+    'SHEAR': shear.Shear,
+    'SHEAR_GAMMA_PSI': shear.ShearGammaPsi,
+    'MULTIPOLE': multipole.Multipole,
+    'PIXELATED': pixelated_lens.PixelatedPotential,
+    'PIXELATED_DIRAC': pixelated_lens.PixelatedPotentialDirac,
+}
+
+# LaTeX symbols of the parameters of analytical profiles
+_LATEX_SYMBOLS = {
+    'theta_E': r"$\theta_{\rm E}$",
+    'gamma': r"$\gamma'$",
+    'gamma_ext': r"$\gamma_{\rm ext}$",
+    'psi_ext': r"$\psi_{\rm ext}$",
+    'gamma1': r"$\gamma_{\rm 1, ext}$",
+    'gamma2': r"$\gamma_{\rm 2, ext}$",
+    'amp': r"$A$",
+    'R_sersic': r"$R_{\rm Sersic}$",
+    'n_sersic': r"$n_{\rm Sersic}$",
+    'e1': r"$e_1$",
+    'e2': r"$e_2$",
+    'center_x': r"$x_0$",
+    'center_y': r"$y_0$",
+    'ra_0': r"${\rm RA}_0$",
+    'dec_0': r"${\rm Dec}_0$",
+    'm': r"$m$",
+    'a_m': r"$a_m$",
+    'phi_m': r"$\phi_m$",
+    'beta': r"$\beta$",
+}
+
+# LaTeX symbols of pixelated and basis-set profiles, by prefix of the (indexed) parameter names
+_LATEX_PIXEL_SYMBOLS = {
+    's_': r"s",
+    'l_': r"l",
+    'psi_': r"\psi",
+    'amp_': r"A",
+}
+
+# profile classes, looked up by kwargs key and model name
+_PROFILE_CLASSES = {
+    'kwargs_lens': _MASS_PROFILE_CLASSES,
+    'kwargs_source': _LIGHT_PROFILE_CLASSES,
+    'kwargs_lens_light': _LIGHT_PROFILE_CLASSES,
+}
+
+
 class Parameters(object):
     """Class that manages parameters in JAX / auto-differentiable framework.
     Currently, it handles:
@@ -123,15 +186,12 @@ class Parameters(object):
 
     @property
     def names(self):
-        if not hasattr(self, '_names'):
-            self._names = self._set_names('mass_model_list', 'kwargs_lens')
-            self._names += self._set_names('source_model_list', 'kwargs_source')
-            self._names += self._set_names('lens_light_model_list', 'kwargs_lens_light')
         return self._names
 
     @property
     def symbols(self):
-        if not hasattr(self, '_symbols'):
+        # NOTE: not set with the names, as unknown LaTeX symbols raise an error
+        if self._symbols is None:
             self._symbols = self._name2latex(self.names)
         return self._symbols
 
@@ -229,10 +289,11 @@ class Parameters(object):
 
     # @partial(jit, static_argnums=(0,))
     def kwargs2args(self, kwargs):
-        args = self._set_params(kwargs, 'mass_model_list', 'kwargs_lens')
-        args += self._set_params(kwargs, 'source_model_list', 'kwargs_source')
-        args += self._set_params(kwargs, 'lens_light_model_list', 'kwargs_lens_light')
-        return jnp.array(args)
+        args = np.empty(self._num_params)
+        i = self._set_params(kwargs, args, 0, 'mass_model_list', 'kwargs_lens')
+        i = self._set_params(kwargs, args, i, 'source_model_list', 'kwargs_source')
+        i = self._set_params(kwargs, args, i, 'lens_light_model_list', 'kwargs_lens_light')
+        return jnp.asarray(args)
 
     def kwargs2args_prior(self, kwargs_prior):
         types_m, lowers_m, uppers_m, means_m, widths_m = self._set_params_prior(kwargs_prior, 'mass_model_list', 'kwargs_lens')
@@ -246,91 +307,41 @@ class Parameters(object):
         return types, np.array(lowers), np.array(uppers), np.array(means), np.array(widths)
 
     def log_prior(self, args):
-        logP = 0
-        for i in range(self.num_parameters):
-            gaussian_prior = self._prior_types[i] == 'gaussian'
-            uniform_prior  = self._prior_types[i] == 'uniform'
-            logP += lax.cond(gaussian_prior, lambda _: - 0.5 * ((args[i] - self._means[i]) / self._widths[i]) ** 2, lambda _: 0., operand=None)
-            logP += lax.cond(uniform_prior, lambda _: lax.cond(args[i] < self._lowers[i], lambda _: - self._unif_prior_penalty, lambda _: 0., operand=None), lambda _: 0., operand=None)
-            logP += lax.cond(uniform_prior, lambda _: lax.cond(args[i] > self._uppers[i], lambda _: - self._unif_prior_penalty, lambda _: 0., operand=None), lambda _: 0., operand=None)
-        return logP
+        # evaluated for all parameters at once, using the arrays set in _update_arrays()
+        out_of_bounds = (args < self._lowers_jax) | (args > self._uppers_jax)
+        logP_uniform = jnp.where(out_of_bounds, - self._unif_prior_penalty, 0.)
+        return (self.log_prior_gaussian(args)
+                + jnp.sum(jnp.where(self._uniform_mask_jax, logP_uniform, 0.)))
 
     def log_prior_gaussian(self, args):
-        logP = 0
-        for i in range(self.num_parameters):
-            gaussian_prior = self._prior_types[i] == 'gaussian'
-            logP += lax.cond(gaussian_prior, lambda _: - 0.5 * ((args[i] - self._means[i]) / self._widths[i]) ** 2, lambda _: 0., operand=None)
-        return logP
+        logP = - 0.5 * ((args - self._gaussian_means_jax) / self._gaussian_widths_jax) ** 2
+        return jnp.sum(jnp.where(self._gaussian_mask_jax, logP, 0.))
 
     def log_prior_uniform(self, args):
-        logP = 0.
-        for i in range(self.num_parameters):
-            uniform_prior  = self._prior_types[i] == 'uniform'
-            # logP += lax.cond(uniform_prior, lambda _: lax.cond(args[i] < self._lowers[i], lambda _: - self._unif_prior_penalty, lambda _: 0., operand=None), lambda _: 0., operand=None)
-            # logP += lax.cond(uniform_prior, lambda _: lax.cond(args[i] > self._uppers[i], lambda _: - self._unif_prior_penalty, lambda _: 0., operand=None), lambda _: 0., operand=None)
-            logP += lax.cond(uniform_prior, lambda _: - (args[i] - jnp.clip(args[i], a_min=self._lowers[i], a_max=self._uppers[i]))**2, lambda _: 0., operand=None)
-        return logP
+        logP = - (args - jnp.clip(args, a_min=self._lowers_jax, a_max=self._uppers_jax))**2
+        return jnp.sum(jnp.where(self._uniform_mask_jax, logP, 0.))
 
     def apply_bounds(self, args):
         return jnp.clip(args, a_min=self._lowers, a_max=self._uppers)
 
     def log_prior_nojit(self, args):
-        logP = 0
-        for i in range(self.num_parameters):
-            if self._prior_types[i] == 'gaussian':
-                logP += - 0.5 * ((args[i] - self._means[i]) / self._widths[i]) ** 2
-            elif self._prior_types[i] == 'uniform' and not (self._lowers[i] <= args[i] <= self._uppers[i]):
-                logP += - self._unif_prior_penalty
-        return logP
+        # NumPy version of log_prior(), using the same masks
+        args = np.asarray(args)
+        logP_gaussian = - 0.5 * ((args - self._gaussian_means) / self._gaussian_widths) ** 2
+        out_of_bounds = ~((self._lowers <= args) & (args <= self._uppers))
+        num_out_of_bounds = np.count_nonzero(self._uniform_mask & out_of_bounds)
+        return float(np.sum(logP_gaussian, where=self._gaussian_mask)) - num_out_of_bounds * self._unif_prior_penalty
 
     @staticmethod
     def get_class_for_model(kwargs_key, model):
         # TODO: move outside of this class
-        profile_class = None
         if kwargs_key in ['kwargs_source', 'kwargs_lens_light']:
             if model not in LIGHT_MODELS:
                 raise ValueError(f"'{model}' is not supported.")
-            if model == 'GAUSSIAN':
-                profile_class = gaussian.Gaussian
-            if model == 'GAUSSIAN_ELLIPSE':
-                profile_class = gaussian.GaussianEllipse
-            elif model == 'SERSIC':
-                profile_class = sersic.Sersic
-            elif model == 'SERSIC_ELLIPSE':
-                profile_class = sersic.SersicElliptic
-            elif model == 'CORE_SERSIC':
-                profile_class = sersic.CoreSersic
-            elif model == 'UNIFORM':
-                profile_class = uniform.Uniform
-            elif model == 'PIXELATED':
-                profile_class = pixelated_light.Pixelated
-            elif model == 'SHAPELETS':
-                profile_class = shapelets.Shapelets
         elif kwargs_key == 'kwargs_lens':
             if model not in MASS_MODELS:
-                raise ValueError("'{model}' is not supported.")
-            elif model == 'GAUSSIAN':
-                profile_class = gaussian_potential.Gaussian
-            elif model == 'EPL':
-                profile_class = epl.EPL
-            elif model == 'SIE':
-                profile_class = sie.SIE
-            elif model == 'SIS':
-                profile_class = sis.SIS
-            elif model == 'NIE':
-                profile_class = nie.NIE
-            elif model == 'POINT_MASS':
-                profile_class = point_mass.PointMass
-            elif model == 'SHEAR':
-                profile_class = shear.Shear
-            elif model == 'SHEAR_GAMMA_PSI':
-                profile_class = shear.ShearGammaPsi
-            elif model == 'MULTIPOLE':
-                profile_class = multipole.Multipole
-            elif model == 'PIXELATED':
-                profile_class = pixelated_lens.PixelatedPotential
-            elif model == 'PIXELATED_DIRAC':
-                profile_class = pixelated_lens.PixelatedPotentialDirac
+                raise ValueError(f"'{model}' is not supported.")
+        profile_class = _PROFILE_CLASSES.get(kwargs_key, {}).get(model)
         if profile_class is None:
             raise ValueError(f"Could not find the model class for '{model}'")
         return profile_class
@@ -343,15 +354,27 @@ class Parameters(object):
         self._kwargs_fixed = self._update_fixed_with_joint(self._kwargs_fixed, self._kwargs_joint)
         self._prior_types, self._lowers, self._uppers, self._means, self._widths \
             = self.kwargs2args_prior(self._kwargs_prior)
+        self._gaussian_mask = np.array([t == 'gaussian' for t in self._prior_types], dtype=bool)
+        self._uniform_mask = np.array([t == 'uniform' for t in self._prior_types], dtype=bool)
+        # means and widths without NaNs, such that gradients of the masked terms remain finite
+        self._gaussian_means = np.where(self._gaussian_mask, self._means, 0.)
+        self._gaussian_widths = np.where(self._gaussian_mask, self._widths, 1.)
+        # device copies of the above, such that the jitted log-priors do not rebuild them at each call
+        self._gaussian_mask_jax = jnp.asarray(self._gaussian_mask)
+        self._uniform_mask_jax = jnp.asarray(self._uniform_mask)
+        self._gaussian_means_jax = jnp.asarray(self._gaussian_means)
+        self._gaussian_widths_jax = jnp.asarray(self._gaussian_widths)
+        self._lowers_jax = jnp.asarray(self._lowers)
+        self._uppers_jax = jnp.asarray(self._uppers)
+        self._num_params = len(self._prior_types)  # one prior type per parameter
         self._init_values = self.kwargs2args(self._kwargs_init)
         self._kwargs_init = self.args2kwargs(self._init_values)  # for updating missing fields
-        self._num_params = len(self._init_values)
         if self.optimized:
             self._map_values = self.kwargs2args(self._kwargs_map)
-        if hasattr(self, '_names'):
-            delattr(self, '_names')
-        if hasattr(self, '_symbols'):
-            delattr(self, '_symbols')
+        self._names = self._set_names('mass_model_list', 'kwargs_lens')
+        self._names += self._set_names('source_model_list', 'kwargs_source')
+        self._names += self._set_names('lens_light_model_list', 'kwargs_lens_light')
+        self._symbols = None
         if hasattr(self, '_samples'):
             delattr(self, '_samples')
         if hasattr(self, '_kwargs_samples'):
@@ -424,8 +447,8 @@ class Parameters(object):
             kwargs_list.append(kwargs)
         return kwargs_list, i
 
-    def _set_params(self, kwargs, kwargs_model_key, kwargs_key):
-        args = []
+    def _set_params(self, kwargs, args, i, kwargs_model_key, kwargs_key):
+        """fills the array args with parameter values starting at index i, and returns the next index"""
         for k, model in enumerate(self.kwargs_model[kwargs_model_key]):
             kwargs_profile = kwargs[kwargs_key][k]
             kwargs_fixed_k = self._kwargs_fixed[kwargs_key][k]
@@ -444,7 +467,8 @@ class Parameters(object):
                             pixels = pixels * np.ones((n_pix_x, n_pix_y))
                         elif pixels.shape != (n_pix_x, n_pix_y):
                             raise ValueError("Pixelated array is inconsistent with pixelated grid.")
-                        args += pixels.flatten().tolist()
+                        num_param = int(n_pix_x * n_pix_y)
+                        args[i:i + num_param] = np.ravel(pixels)
                     elif model == 'SHAPELETS' and name == 'amps':
                         amps = kwargs_profile['amps']
                         if kwargs_key == 'kwargs_source':
@@ -455,10 +479,12 @@ class Parameters(object):
                             raise ValueError("Basis functions can only be in the source or lens light.")
                         if len(amps) != num_param:
                             raise ValueError("Number of functions' amplitudes is not the on expected.")
-                        args += np.asarray(amps).flatten().tolist()
+                        args[i:i + num_param] = np.ravel(amps)
                     else:
-                        args.append(kwargs_profile[name])
-        return args
+                        num_param = 1
+                        args[i] = kwargs_profile[name]
+                    i += num_param
+        return i
 
     def _set_params_prior(self, kwargs, kwargs_model_key, kwargs_key):
         types, lowers, uppers, means, widths = [], [], [], [], []
@@ -580,7 +606,7 @@ class Parameters(object):
                     elif model == 'SHAPELETS' and name == 'amps':
                         if kwargs_key == 'kwargs_source':
                             num_param = self._image.SourceModel.num_amplitudes_list[k]
-                        elif kwargs_key == 'kwargs_lens':
+                        elif kwargs_key == 'kwargs_lens_light':
                             num_param = self._image.LensLightModel.num_amplitudes_list[k]
                         names_k = [f"amp_{i}" for i in range(num_param)]
                     else:
@@ -593,54 +619,16 @@ class Parameters(object):
         # TODO: move outside of this class
         name, model_type, profile_idx = name_raw.split('-')   # encapsulate this line in a well-named method
 
-        # pixelated models
-        if name[:2] == 's_':  
-            latex = r"$s_{" + r"{}".format(int(name[2:])) + r"}$"
-        elif name[:2] == 'l_':  
-            latex = r"$l_{" + r"{}".format(int(name[2:])) + r"}$"
-        elif name[:4] == 'psi_':  
-            latex = r"$\psi_{" + r"{}".format(int(name[4:])) + r"}$"
-
         # analytical models
-        elif name == 'theta_E':
-            latex = r"$\theta_{\rm E}$"
-        elif name == 'gamma':
-            latex = r"$\gamma'$"
-        elif name == 'gamma_ext':
-            latex = r"$\gamma_{\rm ext}$"
-        elif name == 'psi_ext':
-            latex = r"$\psi_{\rm ext}$"
-        elif name == 'gamma1':
-            latex = r"$\gamma_{\rm 1, ext}$"
-        elif name == 'gamma2':
-            latex = r"$\gamma_{\rm 2, ext}$"
-        elif name == 'amp':
-            latex = r"$A$"
-        elif name == 'R_sersic':
-            latex = r"$R_{\rm Sersic}$"
-        elif name == 'n_sersic':
-            latex = r"$n_{\rm Sersic}$"
-        elif name == 'e1':
-            latex = r"$e_1$"
-        elif name == 'e2':
-            latex = r"$e_2$"
-        elif name == 'center_x':
-            latex = r"$x_0$"
-        elif name == 'center_y':
-            latex = r"$y_0$"
-        elif name == 'ra_0':
-            latex = r"${\rm RA}_0$"
-        elif name == 'dec_0':
-            latex = r"${\rm Dec}_0$"
-        elif name == 'm':
-            latex = r"$m$"
-        elif name == 'a_m':
-            latex = r"$a_m$"
-        elif name == 'phi_m':
-            latex = r"$\phi_m$"
-        else:
-            raise ValueError("latex symbol for variable '{}' is unknown".format(name))
-        return latex
+        latex = _LATEX_SYMBOLS.get(name)
+        if latex is not None:
+            return latex
+
+        # pixelated and basis-set models
+        for prefix, symbol in _LATEX_PIXEL_SYMBOLS.items():
+            if name.startswith(prefix):
+                return r"$" + symbol + r"_{" + r"{}".format(int(name[len(prefix):])) + r"}$"
+        raise ValueError("latex symbol for variable '{}' is unknown".format(name))
 
     def _name2latex(self, names):
         latexs = []
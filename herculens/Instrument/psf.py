@@ -10,7 +10,7 @@ __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 import warnings
 import numpy as np
 from herculens.Util import util, kernel_util
-from utax.convolution.functions import build_convolution_matrix
+from herculens.Util.linear_util import build_convolution_matrix
 
 
 __all__ = ['PSF']
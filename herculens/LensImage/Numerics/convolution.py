@@ -10,11 +10,16 @@ __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 import numpy as np
 import jax.numpy as jnp
 import jax.scipy as jsp
+from functools import partial
+from jax import jit, lax
+from scipy import fft as sp_fft
+from scipy import signal as sp_signal
+from jax.experimental import sparse as jsparse
 
 from utax.convolution.classes import GaussianFilter
-from utax.convolution.functions import build_convolution_matrix
+from herculens.Util.linear_util import build_convolution_matrix
 
-from herculens.Util import util, kernel_util, image_util
+from herculens.Util import kernel_util, image_util
 
 
 __all__ = ['PixelKernelConvolution', 'SubgridKernelConvolution', 'GaussianConvolution']
@@ -25,26 +30,53 @@ class PixelKernelConvolution(object):
     class to compute convolutions for a given pixelized kernel
     """
 
-    _conv_types = ['jax_scipy_fft', 'jax_scipy', 'matrix']
+    _conv_types = ['jax_scipy_fft', 'jax_scipy', 'fft', 'matrix', 'auto']
 
     def __init__(self, kernel, convolution_type='jax_scipy_fft', output_shape=None):
         """
 
         :param kernel: 2d array, convolution kernel
+        :param convolution_type: 'jax_scipy_fft', 'jax_scipy', 'fft', 'matrix' or 'auto';
+        'fft' and 'matrix' precompute the kernel transform for images of shape output_shape,
+        'auto' picks once between 'fft' and direct convolution ('jax_scipy') for that shape
+        :param output_shape: shape of the images to be convolved (required for 'fft', 'matrix' and 'auto')
         """
         self._kernel = kernel
         if convolution_type not in self._conv_types:
             raise ValueError(f"Convolution type '{convolution_type}' not supported "
                              f"(should in {self._conv_types}).")
-        self._conv_type = convolution_type
-        if self._conv_type == 'matrix':
+        if convolution_type == 'auto':
             if output_shape is None:
-                raise ValueError("An output shape must be provided to build the convolution matrix.")
+                raise ValueError("An output shape must be provided for the 'auto' convolution type.")
+            method = sp_signal.choose_conv_method(np.zeros(output_shape), np.asarray(kernel), mode='same')
+            convolution_type = 'fft' if method == 'fft' else 'jax_scipy'
+        self._conv_type = convolution_type
+        self._conv_matrix  = None
+        self._conv_matrix_jax = None
+        self._kernel_fft = None
+        self._output_shape = None
+        if self._conv_type in ('fft', 'matrix') and output_shape is None:
+            raise ValueError(f"An output shape must be provided for the '{self._conv_type}' convolution type.")
+        if self._conv_type == 'jax_scipy':
+            # flipped kernel and 'same' padding of a direct convolution, passed as is to lax.conv_general_dilated
+            self._kernel_flipped = jnp.flip(jnp.asarray(kernel, dtype=float))[None, None]
+            self._conv_padding = tuple((k - 1 - (k - 1) // 2, (k - 1) // 2) for k in np.shape(kernel))
+        elif self._conv_type == 'matrix':
             self._conv_matrix  = build_convolution_matrix(kernel, output_shape)
+            # sparse copy for products with (possibly traced) JAX arrays
+            self._conv_matrix_jax = jsparse.BCOO.from_scipy_sparse(self._conv_matrix)
+            self._output_shape = output_shape
+        elif self._conv_type == 'fft':
+            # kernel transform on a zero-padded grid large enough for a linear convolution,
+            # with sizes that factor well for the FFT
+            kernel_shape = np.shape(kernel)
+            self._fft_shape = tuple(sp_fft.next_fast_len(n + k - 1, real=True)
+                                    for n, k in zip(output_shape, kernel_shape))
+            self._kernel_fft = jnp.fft.rfft2(jnp.asarray(kernel), s=self._fft_shape)
+            # 'same' mode: crop the full convolution to the input image, centered on the kernel
+            self._fft_crop = tuple(slice((k - 1) // 2, (k - 1) // 2 + n)
+                                   for n, k in zip(output_shape, kernel_shape))
             self._output_shape = output_shape
-        else:
-            self._conv_matrix  = None
-            self._output_shape = None
 
     def pixel_kernel(self, num_pix=None):
         """
@@ -57,18 +89,26 @@ class PixelKernelConvolution(object):
             return kernel_util.cut_psf(self._kernel, num_pix)
         return self._kernel
 
+    @partial(jit, static_argnums=(0,))
     def convolution2d(self, image):
         """
 
         :param image: 2d array (image) to be convolved
         :return: fft convolution
         """
+        # compiled once per image shape and dtype, with the kernel (or its transform) and
+        # the padding settings above baked in as constants
         if self._conv_type == 'jax_scipy_fft':
             return jsp.signal.fftconvolve(image, self._kernel, mode='same')
         elif self._conv_type == 'jax_scipy':
-            return jsp.signal.convolve2d(image, self._kernel, mode='same')
+            image = jnp.asarray(image, dtype=self._kernel_flipped.dtype)
+            return lax.conv_general_dilated(image[None, None], self._kernel_flipped,
+                                            (1, 1), self._conv_padding)[0, 0]
+        elif self._conv_type == 'fft':
+            image_fft = jnp.fft.rfft2(image, s=self._fft_shape)
+            return jnp.fft.irfft2(image_fft * self._kernel_fft, s=self._fft_shape)[self._fft_crop]
         elif self._conv_type == 'matrix':
-            return self._conv_matrix.dot(image.flatten()).reshape(*self._output_shape)
+            return (self._conv_matrix_jax @ image.flatten()).reshape(*self._output_shape)
 
     def re_size_convolve(self, image_low_res, image_high_res=None):
         """
@@ -88,13 +128,16 @@ class SubgridKernelConvolution(object):
     """
     class to compute the convolution on a supersampled grid with partial convolution computed on the regular grid
     """
-    def __init__(self, kernel_supersampled, supersampling_factor, supersampling_kernel_size=None):
+    def __init__(self, kernel_supersampled, supersampling_factor, supersampling_kernel_size=None,
+                 convolution_type='jax_scipy_fft', output_shape=None):
         """
 
         :param kernel_supersampled: kernel in supersampled pixels
         :param supersampling_factor: supersampling factor relative to the image pixel grid
         :param supersampling_kernel_size: number of pixels (in units of the image pixels) that are convolved with the
         supersampled kernel
+        :param convolution_type: convolution type of both PixelKernelConvolution instances (see its docstring)
+        :param output_shape: shape of the (non-supersampled) images, required for the 'fft' and 'matrix' types
         """
         n_high = len(kernel_supersampled)
         self._supersampling_factor = supersampling_factor
@@ -106,31 +149,62 @@ class SubgridKernelConvolution(object):
             kernel_low_res, kernel_high_res = kernel_util.split_kernel(kernel_supersampled, supersampling_kernel_size,
                                                                        self._supersampling_factor)
             self._low_res_convolution = True
-        self._low_res_conv = PixelKernelConvolution(kernel_low_res)
-        self._high_res_conv = PixelKernelConvolution(kernel_high_res)
+        if output_shape is not None:
+            high_res_shape = tuple(n * self._supersampling_factor for n in output_shape)
+        else:
+            high_res_shape = None
+        self._low_res_conv = PixelKernelConvolution(kernel_low_res, convolution_type=convolution_type,
+                                                    output_shape=output_shape)
+        self._high_res_conv = PixelKernelConvolution(kernel_high_res, convolution_type=convolution_type,
+                                                     output_shape=high_res_shape)
+        self._fused_re_size = False
+        if convolution_type == 'fft' and self._supersampling_factor > 1:
+            # the block-averaging of re_size() can be folded into the kernel, such that the
+            # image at the regular resolution is read directly off the convolution output;
+            # this is only worth it if the (larger) kernel does not require a larger FFT
+            f = self._supersampling_factor
+            kernel_re_size = sp_signal.convolve2d(np.asarray(kernel_high_res), np.ones((f, f)) / f**2)
+            self._re_size_fft_shape = tuple(sp_fft.next_fast_len(n + k - 1, real=True)
+                                            for n, k in zip(high_res_shape, kernel_re_size.shape))
+            self._fused_re_size = np.prod(self._re_size_fft_shape) <= np.prod(self._high_res_conv._fft_shape)
+        if self._fused_re_size:
+            self._re_size_kernel_fft = jnp.fft.rfft2(jnp.asarray(kernel_re_size), s=self._re_size_fft_shape)
+            self._re_size_crop = tuple(slice((k - 1) // 2 + f - 1, (k - 1) // 2 + f - 1 + n * f, f)
+                                       for n, k in zip(output_shape, np.shape(kernel_high_res)))
+
+    def _high_res_convolve_re_size(self, image_high_res):
+        """
+        Convolves the supersampled image with the supersampled kernel and re-sizes it to the regular grid.
+        """
+        if self._fused_re_size:
+            image_fft = jnp.fft.rfft2(image_high_res, s=self._re_size_fft_shape)
+            image_conv = jnp.fft.irfft2(image_fft * self._re_size_kernel_fft, s=self._re_size_fft_shape)
+            return image_conv[self._re_size_crop]
+        image_high_res_conv = self._high_res_conv.convolution2d(image_high_res)
+        return image_util.re_size(image_high_res_conv, self._supersampling_factor)
 
+    @partial(jit, static_argnums=(0,))
     def convolution2d(self, image):
         """
 
         :param image: 2d array (high resoluton image) to be convolved and re-sized
         :return: convolved image
         """
-
-        image_high_res_conv = self._high_res_conv.convolution2d(image)
-        image_resized_conv = image_util.re_size(image_high_res_conv, self._supersampling_factor)
+        # both convolutions and the re-sizing compiled as a single function
+        image_resized_conv = self._high_res_convolve_re_size(image)
         if self._low_res_convolution is True:
             image_resized = image_util.re_size(image, self._supersampling_factor)
             image_resized_conv += self._low_res_conv.convolution2d(image_resized)
         return image_resized_conv
 
+    @partial(jit, static_argnums=(0,))
     def re_size_convolve(self, image_low_res, image_high_res):
         """
 
         :param image_high_res: supersampled image/model to be convolved on a regular pixel grid
         :return: convolved and re-sized image
         """
-        image_high_res_conv = self._high_res_conv.convolution2d(image_high_res)
-        image_resized_conv = image_util.re_size(image_high_res_conv, self._supersampling_factor)
+        image_resized_conv = self._high_res_convolve_re_size(image_high_res)
         if self._low_res_convolution is True:
             image_resized_conv += self._low_res_conv.convolution2d(image_low_res)
         return image_resized_conv
@@ -142,7 +216,12 @@ class GaussianConvolution(object):
     """
 
     def __init__(self, sigma, pixel_scale, supersampling_factor=1,
-                 supersampling_convolution=False, truncation=2):
+                 supersampling_convolution=False, truncation=2, compute_dtype=None):
+        """
+
+        :param compute_dtype: if not None, dtype (e.g. jnp.bfloat16) in which the filter weights
+        are stored and the convolution is performed; the result is cast back to the input dtype
+        """
         self._sigma = sigma / pixel_scale
         if supersampling_convolution is True:
             self._sigma *= supersampling_factor
@@ -151,6 +230,10 @@ class GaussianConvolution(object):
         self._supersampling_factor = supersampling_factor
         self._supersampling_convolution = supersampling_convolution
         self._gaussian_filter = GaussianFilter(self._sigma, self._truncation)
+        self._compute_dtype = compute_dtype
+        self._pixel_kernels = {}  # pixel_kernel() outputs, one per kernel size
+        if compute_dtype is not None and self._gaussian_filter.kernel is not None:
+            self._gaussian_filter.kernel = self._gaussian_filter.kernel.astype(compute_dtype)
 
     def convolution2d(self, image):
         """
@@ -159,7 +242,11 @@ class GaussianConvolution(object):
         :param image: 2d numpy array, image to be convolved
         :return: convolved image, 2d numpy array
         """
-        return self._gaussian_filter(image)
+        if self._compute_dtype is None:
+            return self._gaussian_filter(image)
+        image = jnp.asarray(image)
+        image_conv = self._gaussian_filter(image.astype(self._compute_dtype))
+        return image_conv.astype(jnp.promote_types(image.dtype, jnp.float32))
 
     def re_size_convolve(self, image_low_res, image_high_res):
         """
@@ -181,9 +268,16 @@ class GaussianConvolution(object):
         :param num_pix: int, size of kernel (odd number per axis)
         :return: pixel kernel centered
         """
-        x, y = util.make_grid(numPix=num_pix, deltapix=self._pixel_scale)
-        sigma = self._sigma
-        diff_square = (x - center_x) ** 2 / sigma**2 + (y - center_y) ** 2 / sigma**2
-        kernel = jnp.exp(- diff_square / 2.)
-        kernel = util.array2image(kernel)
+        if num_pix not in self._pixel_kernels:
+            self._pixel_kernels[num_pix] = self._make_pixel_kernel(num_pix)
+        return self._pixel_kernels[num_pix]
+
+    def _make_pixel_kernel(self, num_pix):
+        sigma = self._sigma  # in units of (possibly supersampled) pixels
+        if self._supersampling_convolution is True:
+            sigma /= self._supersampling_factor
+        # the Gaussian is separable, so the 2d kernel is the outer product of two 1d profiles
+        x = jnp.arange(num_pix) - (num_pix - 1) / 2.
+        kernel_1d = jnp.exp(- x**2 / (2. * sigma**2))
+        kernel = jnp.outer(kernel_1d, kernel_1d)
         return kernel / jnp.sum(kernel)
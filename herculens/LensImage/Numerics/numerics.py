@@ -29,16 +29,20 @@ class Numerics(object):
     def __init__(self, pixel_grid, psf, supersampling_factor=1, convolution_type='jax_scipy_fft',
                  supersampling_convolution=False, iterative_kernel_supersampling=True,
                  supersampling_kernel_size=5, point_source_supersampling_factor=1,
-                 convolution_kernel_size=None, truncation=4):
+                 convolution_kernel_size=None, truncation=4, convolution_dtype=None):
         """
 
         :param pixel_grid: PixelGrid() class instance
         :param psf: PSF() class instance
         :param supersampling_factor: int, factor of higher resolution sub-pixel sampling of surface brightness
+        :param convolution_type: convolution method for 'PIXEL' PSFs (see PixelKernelConvolution); 'fft'
+        uses real FFTs with the kernel transform computed once for the image shape
         :param supersampling_convolution: bool, if True, performs (part of) the convolution on the super-sampled
         grid/pixels
         :param point_source_supersampling_factor: super-sampling resolution of the point source placing
         :param convolution_kernel_size: int, odd number, size of convolution kernel. If None, takes size of point_source_kernel
+        :param convolution_dtype: for 'GAUSSIAN' PSFs, reduced precision dtype (e.g. 'bfloat16') in which the
+        convolution is performed, or None to convolve in the dtype of the image
         """
         # if no super sampling, turn the supersampling convolution off
         self._psf_type = psf.psf_type
@@ -63,7 +67,9 @@ class Numerics(object):
                     kernel_super = self._supersampling_cut_kernel(kernel_super, convolution_kernel_size,
                                                                   supersampling_factor)
                 self._conv = SubgridKernelConvolution(kernel_super, supersampling_factor,
-                                                      supersampling_kernel_size=supersampling_kernel_size)
+                                                      supersampling_kernel_size=supersampling_kernel_size,
+                                                      convolution_type=convolution_type,
+                                                      output_shape=(nx, ny))
             else:
                 kernel = psf.kernel_point_source
                 kernel = self._supersampling_cut_kernel(kernel, convolution_kernel_size,
@@ -74,7 +80,8 @@ class Numerics(object):
             pixel_scale = pixel_grid.pixel_width
             sigma = util.fwhm2sigma(psf.fwhm)
             self._conv = GaussianConvolution(sigma, pixel_scale, supersampling_factor,
-                                             supersampling_convolution, truncation=truncation)
+                                             supersampling_convolution, truncation=truncation,
+                                             compute_dtype=convolution_dtype)
         elif self._psf_type == 'NONE':
             self._conv = None
         else:
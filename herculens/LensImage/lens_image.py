@@ -9,17 +9,32 @@ __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 import copy
 import numpy as np
 import jax.numpy as jnp
-from functools import partial
+from functools import partial, lru_cache
 from jax import jit
 from jax import random
+from jax import lax
 
 from herculens.LensImage.Numerics.numerics import Numerics
 from herculens.LensImage.lensing_operator import LensingOperator
+from herculens.MassModel.mass_model import MassModel
+from herculens.LightModel.light_model import LightModel
 
 
 __all__ = ['LensImage', 'LensImage3D']
 
 
+@lru_cache(maxsize=None)
+def _get_empty_mass_model():
+    """Returns a mass model without any profile, shared by all LensImage instances."""
+    return MassModel(mass_model_list=[])
+
+
+@lru_cache(maxsize=None)
+def _get_empty_light_model():
+    """Returns a light model without any profile, shared by all LensImage instances."""
+    return LightModel(light_model_list=[])
+
+
 class LensImage(object):
     """Generate lensed images from source light, lens mass/light, and point source models."""
 
@@ -29,7 +44,8 @@ class LensImage(object):
                  point_source_model_class=None, 
                  source_arc_mask=None,
                  kwargs_numerics=None,
-                 kwargs_lens_equation_solver=None):
+                 kwargs_lens_equation_solver=None,
+                 dtype=None):
         """
         :param grid_class: coordinate system, instance of PixelGrid() from herculens.Coordinates.pixel_grid
         :param psf_class: point spread function, instance of PSF() from herculens.Instrument.psf
@@ -41,9 +57,14 @@ class LensImage(object):
         :param source_arc_mask: 2D boolean array to define the region over which the (pixelated) lensed source is modeled
         :param kwargs_numerics: keyword arguments for various numerical settings (see herculens.Numerics.numerics)
         :param kwargs_lens_equation_solver: TODO
+        :param dtype: if not None, dtype (e.g. jnp.bfloat16) to which the surface brightness
+        of each model component and the model image are cast, to reduce memory usage of the image-level operations.
+        Coordinates and convolution are kept in the default precision.
         """
         self.Grid = grid_class
+        self._dtype = dtype
         self.PSF = psf_class
+        self._image_shape = tuple(self.Grid.num_pixel_axes)
         self.Noise = noise_class
 
         # Require now that all relevant parameters of the PSF model are provided
@@ -55,8 +76,7 @@ class LensImage(object):
         # self.PSF.set_pixel_size(self.Grid.pixel_width)
 
         if lens_mass_model_class is None:
-            from herculens.MassModel.mass_model import MassModel
-            lens_mass_model_class = MassModel(mass_model_list=[])
+            lens_mass_model_class = _get_empty_mass_model()
         self.MassModel = lens_mass_model_class
         if self.MassModel.has_pixels:
             pixel_grid = self.Grid.create_model_grid(
@@ -64,8 +84,7 @@ class LensImage(object):
             self.MassModel.set_pixel_grid(pixel_grid)
 
         if source_model_class is None:
-            from herculens.LightModel.light_model import LightModel
-            source_model_class = LightModel(light_model_list=[])
+            source_model_class = _get_empty_light_model()
         self.SourceModel = source_model_class
         if self.SourceModel.has_pixels:
             pixel_grid = self.Grid.create_model_grid(
@@ -73,8 +92,7 @@ class LensImage(object):
             self.SourceModel.set_pixel_grid(pixel_grid, self.Grid.pixel_area)
 
         if lens_light_model_class is None:
-            from herculens.LightModel.light_model import LightModel
-            lens_light_model_class = LightModel(light_model_list=[])
+            lens_light_model_class = _get_empty_light_model()
         self.LensLightModel = lens_light_model_class
         if self.LensLightModel.has_pixels:
             pixel_grid = self.Grid.create_model_grid(
@@ -100,12 +118,16 @@ class LensImage(object):
                              "provided with adaptive source grid")
         if self.source_arc_mask is not None:
             self._src_arc_mask_bool = source_arc_mask.astype(bool)
+            self.source_arc_mask = self._cast(self.source_arc_mask)
 
         if kwargs_numerics is None:
             kwargs_numerics = {}
         self.kwargs_numerics = kwargs_numerics
         self.ImageNumerics = Numerics(
             pixel_grid=self.Grid, psf=self.PSF, **self.kwargs_numerics)
+        # coordinates on which the surface brightness is evaluated do not change
+        # once the numerics are set, so we keep a reference to them here
+        self._x_grid_img, self._y_grid_img = self.ImageNumerics.coordinates_evaluate
 
         self.kwargs_lens_equation_solver = kwargs_lens_equation_solver
 
@@ -125,28 +147,70 @@ class LensImage(object):
         :param k_lens: list of bool or list of int to select which lens mass profiles to include
         :return: 2d array of surface brightness pixels
         """
-        if len(self.SourceModel.profile_type_list) == 0:
-            return jnp.zeros(self.Grid.num_pixel_axes)
-        x_grid_img, y_grid_img = self.ImageNumerics.coordinates_evaluate
-        if self._src_adaptive_grid:
-            pixels_x_coord, pixels_y_coord, _ = self.adapt_source_coordinates(kwargs_lens, k_lens=k_lens)
-        else:
-            pixels_x_coord, pixels_y_coord = None, None  # fall back on fixed, user-defined coordinates
+        if len(self.SourceModel.profile_type_list) == 0 or self._selects_none(k):
+            return self._zeros(supersampled)
         if de_lensed is True:
+            x_grid_img, y_grid_img = self._x_grid_img, self._y_grid_img
             if self._src_adaptive_grid:
+                pixels_x_coord, pixels_y_coord, _ = self.adapt_source_coordinates(kwargs_lens, k_lens=k_lens)
                 offset_x, offset_y = pixels_x_coord.mean(), pixels_y_coord.mean()
             else:
+                pixels_x_coord, pixels_y_coord = None, None  # fall back on fixed, user-defined coordinates
                 offset_x, offset_y = 0., 0.
             source_light = self.SourceModel.surface_brightness(x_grid_img+offset_x, y_grid_img+offset_y, kwargs_source, k=k,
                                                                pixels_x_coord=pixels_x_coord, pixels_y_coord=pixels_y_coord)
         else:
-            x_grid_src, y_grid_src = self.MassModel.ray_shooting(x_grid_img, y_grid_img, kwargs_lens, k=k_lens)
-            source_light = self.SourceModel.surface_brightness(x_grid_src, y_grid_src, kwargs_source, k=k,
-                                                               pixels_x_coord=pixels_x_coord, pixels_y_coord=pixels_y_coord)
+            source_light = self._source_flux(kwargs_source, kwargs_lens, k, k_lens)
         if not supersampled:
             source_light = self.ImageNumerics.re_size_convolve(
                 source_light, unconvolved=unconvolved)
-        return source_light
+        return self._cast(source_light)
+
+    def _source_flux(self, kwargs_source, kwargs_lens, k, k_lens):
+        """Lensed source flux on the (possibly supersampled) grid, before convolution."""
+        if self._src_adaptive_grid:
+            pixels_x_coord, pixels_y_coord, _ = self.adapt_source_coordinates(kwargs_lens, k_lens=k_lens)
+        else:
+            pixels_x_coord, pixels_y_coord = None, None  # fall back on fixed, user-defined coordinates
+        return self._lensed_source_flux(kwargs_source, kwargs_lens,
+                                        self._static_selection(k), self._static_selection(k_lens),
+                                        pixels_x_coord, pixels_y_coord)
+
+    @partial(jit, static_argnums=(0, 3, 4))
+    def _lensed_source_flux(self, kwargs_source, kwargs_lens, k, k_lens,
+                            pixels_x_coord, pixels_y_coord):
+        """
+        Ray-shoots the image coordinates to the source plane and evaluates the source light there.
+        This is compiled once per selection of source and lens profiles.
+        """
+        x_grid_src, y_grid_src = self.MassModel.ray_shooting(self._x_grid_img, self._y_grid_img,
+                                                             kwargs_lens, k=k_lens)
+        return self.SourceModel.surface_brightness(x_grid_src, y_grid_src, kwargs_source, k=k,
+                                                   pixels_x_coord=pixels_x_coord, pixels_y_coord=pixels_y_coord)
+
+    def _cast(self, array):
+        """Casts an array to the dtype of the model image, if any."""
+        if self._dtype is None:
+            return array
+        return jnp.asarray(array, dtype=self._dtype)
+
+    def _zeros(self, supersampled):
+        """Empty model, on the supersampled grid if supersampled is True."""
+        if supersampled:
+            return jnp.zeros(jnp.shape(self._x_grid_img))
+        return jnp.zeros(self._image_shape)
+
+    @staticmethod
+    def _selects_none(k):
+        # True if the selection k (None, int, list of int or list of bool) excludes all profiles
+        if k is None or isinstance(k, (int, np.integer)):
+            return False
+        return len(k) == 0 or (isinstance(k[0], (bool, np.bool_)) and not any(k))
+
+    @staticmethod
+    def _static_selection(k):
+        # lists are not hashable hence cannot be used as static arguments
+        return tuple(k) if isinstance(k, (list, np.ndarray)) else k
 
     def lens_surface_brightness(self, kwargs_lens_light, unconvolved=False,
                                 supersampled=False, k=None):
@@ -159,12 +223,14 @@ class LensImage(object):
         :param k: list of bool or list of int to select which model profiles to include
         :return: 2d array of surface brightness pixels
         """
-        x_grid_img, y_grid_img = self.ImageNumerics.coordinates_evaluate
+        if self._selects_none(k):
+            return self._zeros(supersampled)
+        x_grid_img, y_grid_img = self._x_grid_img, self._y_grid_img
         lens_light = self.LensLightModel.surface_brightness(x_grid_img, y_grid_img, kwargs_lens_light, k=k)
         if not supersampled:
             lens_light = self.ImageNumerics.re_size_convolve(
                 lens_light, unconvolved=unconvolved)
-        return lens_light
+        return self._cast(lens_light)
 
     def point_source_image(self, kwargs_point_source, kwargs_lens,
                            kwargs_solver, k=None):
@@ -175,7 +241,7 @@ class LensImage(object):
         :param k: list of bool or list of int to select which point sources to include
         :return: 2d array at the image plane resolution of all multiple images of the point sources
         """
-        result = jnp.zeros((self.Grid.num_pixel_axes))
+        result = jnp.zeros(self._image_shape)
         if self.PointSourceModel is None:
             return result
         theta_x, theta_y, amplitude = self.PointSourceModel.get_multiple_images(
@@ -188,7 +254,6 @@ class LensImage(object):
 
         return result
 
-    @partial(jit, static_argnums=(0, 5, 6, 7, 8, 9, 10, 11, 12, 13))
     def model(self, kwargs_lens=None, kwargs_source=None, kwargs_lens_light=None,
               kwargs_point_source=None, unconvolved=False, supersampled=False,
               source_add=True, lens_light_add=True, point_source_add=True,
@@ -213,28 +278,76 @@ class LensImage(object):
         :param k_point_source: list of bool or list of int to select which point sources to include
         :return: 2d array of surface brightness pixels of the simulation
         """
+        # NOTE: keyword arguments are canonicalized before entering the jitted function
+        # such that, e.g., tuples and lists of dicts, or OrderedDict and dict
+        # are mapped to the same pytree structure and do not trigger a new compilation
+        # the flags and profile selections are static arguments, such that
+        # one specialized function is compiled per combination of them
+        return self._model(
+            self._canonicalize_kwargs(kwargs_lens),
+            self._canonicalize_kwargs(kwargs_source),
+            self._canonicalize_kwargs(kwargs_lens_light),
+            self._canonicalize_kwargs(kwargs_point_source),
+            unconvolved, supersampled, source_add, lens_light_add, point_source_add,
+            self._static_selection(k_lens), self._static_selection(k_source),
+            self._static_selection(k_lens_light), self._static_selection(k_point_source),
+        )
+
+    @partial(jit, static_argnums=(0, 5, 6, 7, 8, 9, 10, 11, 12, 13))
+    def _model(self, kwargs_lens, kwargs_source, kwargs_lens_light,
+               kwargs_point_source, unconvolved, supersampled,
+               source_add, lens_light_add, point_source_add,
+               k_lens, k_source, k_lens_light, k_point_source):
+        """Jitted implementation of `model()`, see its docstring for details."""
         # TODO: simplify treatment of convolution, downsampling and re-sizing
-        model = jnp.zeros((self.Grid.num_pixel_axes))
-        if supersampled:
-            model = jnp.zeros((self.ImageNumerics.grid_class.num_grid_points,))
-        if source_add is True:
+        # NOTE: the *_add flags are static, so only the required components are traced
+        # and summed in a single expression, without allocating an image of zeros first
+        # components for which no profile is selected are pruned at trace time
+        model_components = []
+        add_source = (source_add is True and not self._selects_none(k_source)
+                      and len(self.SourceModel.profile_type_list) > 0)
+        add_lens_light = lens_light_add is True and not self._selects_none(k_lens_light)
+        if add_source and add_lens_light and not supersampled and self.source_arc_mask is None:
+            # convolution (and re-sizing) being linear, the source and lens light
+            # are summed first and the PSF convolution is performed only once
+            flux = (self._source_flux(kwargs_source, kwargs_lens, k_source, k_lens)
+                    + self.LensLightModel.surface_brightness(self._x_grid_img, self._y_grid_img,
+                                                             kwargs_lens_light, k=k_lens_light))
+            model_components.append(self._cast(self.ImageNumerics.re_size_convolve(
+                flux, unconvolved=unconvolved)))
+            add_source = add_lens_light = False
+        if add_source:
             source_model = self.source_surface_brightness(kwargs_source, kwargs_lens, 
                                                           unconvolved=unconvolved, supersampled=supersampled,
                                                           k=k_source, k_lens=k_lens) 
             if self.source_arc_mask is not None:
-                source_model *= self.source_arc_mask
-            model += source_model
-        if lens_light_add is True:
-            model += self.lens_surface_brightness(kwargs_lens_light, 
-                                                  unconvolved=unconvolved, supersampled=supersampled,
-                                                  k=k_lens_light)
-
+                source_model = source_model * self.source_arc_mask
+            model_components.append(source_model)
+        if add_lens_light:
+            model_components.append(self.lens_surface_brightness(kwargs_lens_light, 
+                                                                 unconvolved=unconvolved, supersampled=supersampled,
+                                                                 k=k_lens_light))
         if point_source_add:
-            model += self.point_source_image(kwargs_point_source, kwargs_lens,
-                                             kwargs_solver=self.kwargs_lens_equation_solver,
-                                             k=k_point_source)
-
-        return model
+            model_components.append(self.point_source_image(kwargs_point_source, kwargs_lens,
+                                                            kwargs_solver=self.kwargs_lens_equation_solver,
+                                                            k=k_point_source))
+        if len(model_components) == 0:
+            if supersampled:
+                return self._cast(jnp.zeros((self.ImageNumerics.grid_class.num_grid_points,)))
+            return self._cast(jnp.zeros(self._image_shape))
+        return self._cast(sum(model_components[1:], model_components[0]))
+
+    @staticmethod
+    def _canonicalize_kwargs(kwargs_list):
+        """
+        Converts a list (or tuple) of keyword arguments into a list of plain dicts
+        with sorted keys, such that equivalent inputs share the same pytree structure.
+        """
+        if kwargs_list is None:
+            return None
+        return [
+            {key: kwargs[key] for key in sorted(kwargs.keys())} for kwargs in kwargs_list
+        ]
 
     def simulation(self, add_poisson=True, add_gaussian=True,
                    compute_true_noise_map=True, prng_key=random.PRNGKey(18),
@@ -267,26 +380,35 @@ class LensImage(object):
         compute the map of normalized residuals,
         given the data and the model image
         """
-        if mask is None:
-            mask = np.ones(self.Grid.num_pixel_axes)
         noise_var = self.C_D_model(model)
-        noise = np.sqrt(noise_var)
-        norm_res_model = (data - model) / noise * mask
-        norm_res_tot = norm_res_model
-        if mask is not None:
-            # outside the mask just add pure data
-            norm_res_tot += (data / noise) * (1. - mask)
+        # multiply by the inverse noise rather than dividing by the noise
+        inv_noise = lax.rsqrt(noise_var)
+        if mask is None:
+            # no need to allocate a mask full of ones
+            norm_res_model = (data - model) * inv_noise
+            return norm_res_model, norm_res_model
+        norm_res_model = (data - model) * inv_noise * mask
+        # outside the mask just add pure data
+        norm_res_tot = norm_res_model + (data * inv_noise) * (1. - mask)
         return norm_res_model, norm_res_tot
 
     def reduced_chi2(self, data, model, mask=None):
         """
         compute the reduced chi2 of the data given the model
         """
+        # NOTE: the normalized residuals are not computed explicitly
+        # so that the chi2 is obtained in a single pass over the image
+        noise_var = self.C_D_model(model)
         if mask is None:
-            mask = np.ones(self.Grid.num_pixel_axes)
-        norm_res, _ = self.normalized_residuals(data, model, mask=mask)
-        num_data_points = np.sum(mask)
-        return np.sum(norm_res**2) / num_data_points
+            chi2_map = (data - model)**2 / noise_var
+            num_data_points = jnp.size(data)
+        else:
+            chi2_map = (mask * (data - model))**2 / noise_var
+            num_data_points = jnp.sum(mask)
+        # the sum is accumulated in at least single precision,
+        # in case the model image has a lower precision dtype
+        chi2 = jnp.sum(chi2_map, dtype=jnp.promote_types(chi2_map.dtype, jnp.float32))
+        return chi2 / num_data_points
     
     def adapt_source_coordinates(self, kwargs_lens, k_lens=None, return_plt_extent=False):
         """
@@ -353,7 +475,7 @@ class LensImage(object):
         else:
             x_coord, y_coord, extent = self.adapt_source_coordinates(kwargs_lens, k_lens=k_lens,
                                                                      return_plt_extent=return_plt_extent)
-            x_grid, y_grid = np.meshgrid(x_coord, y_coord)
+            x_grid, y_grid = jnp.meshgrid(x_coord, y_coord)
         return x_grid, y_grid, extent
         
     def get_lensing_operator(self, kwargs_lens=None, update=False, arc_mask=None):
@@ -512,26 +634,35 @@ class LensImage3D(object):
         compute the map of normalized residuals,
         given the data and the model image
         """
-        if mask is None:
-            mask = np.ones_like(data)
         noise_var = self.C_D_model(model)
-        noise = np.sqrt(noise_var)
-        norm_res_model = (data - model) / noise * mask
-        norm_res_tot = norm_res_model
-        if mask is not None:
-            # outside the mask just add pure data
-            norm_res_tot += (data / noise) * (1. - mask)
+        # multiply by the inverse noise rather than dividing by the noise
+        inv_noise = lax.rsqrt(noise_var)
+        if mask is None:
+            # no need to allocate a mask full of ones
+            norm_res_model = (data - model) * inv_noise
+            return norm_res_model, norm_res_model
+        norm_res_model = (data - model) * inv_noise * mask
+        # outside the mask just add pure data
+        norm_res_tot = norm_res_model + (data * inv_noise) * (1. - mask)
         return norm_res_model, norm_res_tot
 
     def reduced_chi2(self, data, model, mask=None):
         """
         compute the reduced chi2 of the data given the model
         """
+        # NOTE: the normalized residuals are not computed explicitly
+        # so that the chi2 is obtained in a single pass over the image
+        noise_var = self.C_D_model(model)
         if mask is None:
-            mask = np.ones_like(data)
-        norm_res, _ = self.normalized_residuals(data, model, mask=mask)
-        num_data_points = np.sum(mask)
-        return np.sum(norm_res**2) / num_data_points
+            chi2_map = (data - model)**2 / noise_var
+            num_data_points = jnp.size(data)
+        else:
+            chi2_map = (mask * (data - model))**2 / noise_var
+            num_data_points = jnp.sum(mask)
+        # the sum is accumulated in at least single precision,
+        # in case the model image has a lower precision dtype
+        chi2 = jnp.sum(chi2_map, dtype=jnp.promote_types(chi2_map.dtype, jnp.float32))
+        return chi2 / num_data_points
     
     def _none_kwargs(self, kwargs):
         return kwargs if kwargs is not None else [None]*self.num_bands
@@ -8,7 +8,9 @@ __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 
 
 import numpy as np
+import jax
 import jax.numpy as jnp
+from jax import lax
 # from functools import partial
 # from jax import jit
 
@@ -54,21 +56,39 @@ class LightModel(LightModelBase):
             List of parameter dictionaries corresponding to each source model.
         k : int, optional
             Position index of a single source model component.
+            If k is a (possibly traced) JAX boolean array with one entry per component,
+            all components are evaluated and those with a False entry are zeroed out,
+            such that different selections share the same compiled function.
+            Note that LensImage passes selections as static arguments, hence
+            traced selections are only supported when calling this method directly.
 
         """
+        mask = None
+        if isinstance(k, jax.Array):
+            mask, k = k, None
         flux = jnp.zeros_like(x)
-        bool_list = self._bool_list(k)
-        for i, func in enumerate(self.func_list):
-            if bool_list[i]:
-                if i == self.pixelated_index:
-                    flux += func.function(x, y, 
-                                          pixels_x_coord=pixels_x_coord, 
-                                          pixels_y_coord=pixels_y_coord, 
-                                          **kwargs_list[i])
-                else:
-                    flux += func.function(x, y, **kwargs_list[i])
+        for func, indices, kwargs, is_stacked in self.group_by_type(kwargs_list, k=k):
+            if is_stacked:
+                # profiles of the same type are traced only once and accumulated in place
+                def add_profile(flux_, xs):
+                    i, kw = xs
+                    return flux_ + self._apply_mask(func.function(x, y, **kw), mask, i), None
+                flux, _ = lax.scan(add_profile, flux, (jnp.array(indices), kwargs))
+            elif indices[0] == self.pixelated_index:
+                flux += self._apply_mask(func.function(x, y, 
+                                                       pixels_x_coord=pixels_x_coord, 
+                                                       pixels_y_coord=pixels_y_coord, 
+                                                       **kwargs), mask, indices[0])
+            else:
+                flux += self._apply_mask(func.function(x, y, **kwargs), mask, indices[0])
         return flux
 
+    @staticmethod
+    def _apply_mask(flux, mask, i):
+        if mask is None:
+            return flux
+        return jnp.where(mask[i], flux, 0.)
+
     def spatial_derivatives(self, x, y, kwargs_list, k=None):
         """Spatial derivatives of the source flux at a given position (along x and y directions).
 
@@ -85,10 +105,8 @@ class LightModel(LightModelBase):
         # x = jnp.array(x, dtype=float)
         # y = jnp.array(y, dtype=float)
         f_x, f_y = jnp.zeros_like(x), jnp.zeros_like(x)
-        bool_list = self._bool_list(k)
-        for i, func in enumerate(self.func_list):
-            if bool_list[i]:
-                f_x_, f_y_ = func.derivatives(x, y, **kwargs_list[i])
-                f_x += f_x_
-                f_y += f_y_
+        for i, func in self._selected_funcs(k):
+            f_x_, f_y_ = func.derivatives(x, y, **kwargs_list[i])
+            f_x += f_x_
+            f_y += f_y_
         return f_x, f_y
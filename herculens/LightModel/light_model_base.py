@@ -11,7 +11,7 @@ import numpy as np
 import jax.numpy as jnp
 
 from herculens.LightModel.Profiles import (sersic, pixelated, uniform, gaussian, multipole)
-from herculens.Util import util
+from herculens.Util.profile_list_base import ProfileListBase
 
 __all__ = ['LightModelBase']
 
@@ -24,7 +24,7 @@ SUPPORTED_MODELS = [
 ]
 
 
-class LightModelBase(object):
+class LightModelBase(ProfileListBase):
     """Base class for source and lens light models."""
     # TODO: instead of settings for creating PixelGrid objects, pass directly the object to the LightModel
     def __init__(self, light_model_list, smoothing=0.001, 
@@ -84,20 +84,20 @@ class LightModelBase(object):
                            f"Supported types are: {SUPPORTED_MODELS}")
                 raise ValueError(err_msg)
         self.func_list = func_list
+        self._func_types = list(light_model_list)
         self._num_func = len(self.func_list)
         self._pix_idx = pix_idx
         if kwargs_pixelated is None:
             kwargs_pixelated = {}
         self._kwargs_pixelated = kwargs_pixelated
+        self._selected_funcs_cache = {}
+        self._selected_groups_cache = {}
 
     @property
     def param_name_list(self):
         """Get parameter names as a list of strings for each light model."""
         return [func.param_names for func in self.func_list]
 
-    def _bool_list(self, k):
-        return util.convert_bool_list(n=self._num_func, k=k)
-
     @property
     def has_pixels(self):
         return self._pix_idx is not None
@@ -37,7 +37,7 @@ class PointMass(object):
         y_ = y - center_y
         r_ = jnp.sqrt(x_**2 + y_**2)
         r  = jnp.clip(r_, a_min=self.r_min)
-        phi = theta_E**2*np.log(r)
+        phi = theta_E**2*jnp.log(r)
         return phi
 
     def derivatives(self, x, y, theta_E, center_x=0, center_y=0):
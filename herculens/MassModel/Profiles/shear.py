@@ -8,6 +8,8 @@ __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 
 
 import numpy as np
+from jax import jit
+
 from herculens.Util import param_util
 
 
@@ -32,10 +34,7 @@ class Shear(object):
         :param dec_0: y/dec position where shear deflection is 0
         :return: lensing potential
         """
-        x_ = x - ra_0
-        y_ = y - dec_0
-        f_ = 0.5 * (gamma1 * x_ * x_ + 2 * gamma2 * x_ * y_ - gamma1 * y_ * y_)
-        return f_
+        return _shear_function(x, y, gamma1, gamma2, ra_0, dec_0)
 
     def derivatives(self, x, y, gamma1, gamma2, ra_0=0, dec_0=0):
         """
@@ -48,11 +47,7 @@ class Shear(object):
         :param dec_0: y/dec position where shear deflection is 0
         :return: deflection angles
         """
-        x_ = x - ra_0
-        y_ = y - dec_0
-        f_x = gamma1 * x_ + gamma2 * y_
-        f_y = gamma2 * x_ - gamma1 * y_
-        return f_x, f_y
+        return _shear_derivatives(x, y, gamma1, gamma2, ra_0, dec_0)
 
     def hessian(self, x, y, gamma1, gamma2, ra_0=0, dec_0=0):
         """
@@ -65,13 +60,7 @@ class Shear(object):
         :param dec_0: y/dec position where shear deflection is 0
         :return: f_xx, f_yy, f_xy
         """
-        gamma1 = gamma1
-        gamma2 = gamma2
-        kappa = 0
-        f_xx = kappa + gamma1
-        f_yy = kappa - gamma1
-        f_xy = gamma2
-        return f_xx, f_yy, f_xy
+        return _shear_hessian(x, y, gamma1, gamma2, ra_0, dec_0)
 
 
 class ShearGammaPsi(object):
@@ -81,11 +70,8 @@ class ShearGammaPsi(object):
     upper_limit_default = {'gamma_ext': 1, 'psi_ext': np.pi, 'ra_0': 100, 'dec_0': 100}
     fixed_default = {'gamma_ext': False, 'psi_ext': False, 'ra_0': True, 'dec_0': True}
     
-    def __init__(self):
-        self._shear_e1e2 = Shear()
-        super(ShearGammaPsi, self).__init__()
-
     @staticmethod
+    @jit
     def function(x, y, gamma_ext, psi_ext, ra_0=0, dec_0=0):
         """
 
@@ -97,16 +83,47 @@ class ShearGammaPsi(object):
         :param dec_0: y/dec position where shear deflection is 0
         :return:
         """
-        # change to polar coordinate
-        r, phi = param_util.cart2polar(x-ra_0, y-dec_0)
-        f_ = 1. / 2 * gamma_ext * r ** 2 * np.cos(2 * (phi - psi_ext))
-        return f_
+        # gamma_ext * r^2 * cos(2(phi - psi_ext)) expanded in cartesian coordinates,
+        # which avoids the conversion to polar coordinates
+        gamma1, gamma2 = param_util.shear_polar2cartesian(psi_ext, gamma_ext)
+        return _shear_function(x, y, gamma1, gamma2, ra_0, dec_0)
 
-    def derivatives(self, x, y, gamma_ext, psi_ext, ra_0=0, dec_0=0):
+    @staticmethod
+    @jit
+    def derivatives(x, y, gamma_ext, psi_ext, ra_0=0, dec_0=0):
         # rotation angle
         gamma1, gamma2 = param_util.shear_polar2cartesian(psi_ext, gamma_ext)
-        return self._shear_e1e2.derivatives(x, y, gamma1, gamma2, ra_0, dec_0)
+        return _shear_derivatives(x, y, gamma1, gamma2, ra_0, dec_0)
 
-    def hessian(self, x, y, gamma_ext, psi_ext, ra_0=0, dec_0=0):
+    @staticmethod
+    @jit
+    def hessian(x, y, gamma_ext, psi_ext, ra_0=0, dec_0=0):
         gamma1, gamma2 = param_util.shear_polar2cartesian(psi_ext, gamma_ext)
-        return self._shear_e1e2.hessian(x, y, gamma1, gamma2, ra_0, dec_0)
+        return _shear_hessian(x, y, gamma1, gamma2, ra_0, dec_0)
+
+
+# pure functions shared by both shear parameterizations, compiled once for all instances
+
+@jit
+def _shear_function(x, y, gamma1, gamma2, ra_0, dec_0):
+    x_ = x - ra_0
+    y_ = y - dec_0
+    return 0.5 * (gamma1 * x_ * x_ + 2 * gamma2 * x_ * y_ - gamma1 * y_ * y_)
+
+
+@jit
+def _shear_derivatives(x, y, gamma1, gamma2, ra_0, dec_0):
+    x_ = x - ra_0
+    y_ = y - dec_0
+    f_x = gamma1 * x_ + gamma2 * y_
+    f_y = gamma2 * x_ - gamma1 * y_
+    return f_x, f_y
+
+
+@jit
+def _shear_hessian(x, y, gamma1, gamma2, ra_0, dec_0):
+    kappa = 0
+    f_xx = kappa + gamma1
+    f_yy = kappa - gamma1
+    f_xy = gamma2
+    return f_xx, f_yy, f_xy
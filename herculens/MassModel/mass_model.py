@@ -27,9 +27,10 @@ class MassModel(MassModelBase):
             Lens model profile names or classes.
         kwargs_pixelated : dictionary for settings related to PIXELATED profiles.
         """
-        self.profile_type_list = mass_model_list
-        super().__init__(self.profile_type_list, kwargs_pixelated=kwargs_pixelated,
+        super().__init__(mass_model_list, kwargs_pixelated=kwargs_pixelated,
                          **kwargs)
+        # profile names, where profiles given as classes are replaced by their name
+        self.profile_type_list = self._model_list
 
     def ray_shooting(self, x, y, kwargs, k=None):
         """
@@ -78,12 +79,7 @@ class MassModel(MassModelBase):
         # y = np.array(y, dtype=float)
         if isinstance(k, int):
             return self.func_list[k].function(x, y, **kwargs[k])
-        bool_list = self._bool_list(k)
-        potential = jnp.zeros_like(x)
-        for i, func in enumerate(self.func_list):
-            if bool_list[i] is True:
-                potential += func.function(x, y, **kwargs[i])
-        return potential
+        return self._sum_profiles('function', x, y, kwargs, k, jnp.zeros_like(x))
 
     def alpha(self, x, y, kwargs, k=None):
 
@@ -102,14 +98,8 @@ class MassModel(MassModelBase):
         if isinstance(k, int):
             return self.func_list[k].derivatives(x, y, **kwargs[k])
 
-        bool_list = self._bool_list(k)
-        f_x, f_y = jnp.zeros_like(x), jnp.zeros_like(x)
-        for i, func in enumerate(self.func_list):
-            if bool_list[i] is True:
-                f_x_i, f_y_i = func.derivatives(x, y, **kwargs[i])
-                f_x += f_x_i
-                f_y += f_y_i
-        return f_x, f_y
+        zeros = jnp.zeros_like(x)
+        return self._sum_profiles('derivatives', x, y, kwargs, k, (zeros, zeros))
 
     def hessian(self, x, y, kwargs, k=None):
         """
@@ -128,14 +118,8 @@ class MassModel(MassModelBase):
             f_xx, f_yy, f_xy = self.func_list[k].hessian(x, y, **kwargs[k])
             return f_xx, f_xy, f_xy, f_yy
 
-        bool_list = self._bool_list(k)
-        f_xx, f_yy, f_xy = jnp.zeros_like(x), jnp.zeros_like(x), jnp.zeros_like(x)
-        for i, func in enumerate(self.func_list):
-            if bool_list[i] is True:
-                f_xx_i, f_yy_i, f_xy_i = func.hessian(x, y, **kwargs[i])
-                f_xx += f_xx_i
-                f_yy += f_yy_i
-                f_xy += f_xy_i
+        zeros = jnp.zeros_like(x)
+        f_xx, f_yy, f_xy = self._sum_profiles('hessian', x, y, kwargs, k, (zeros, zeros, zeros))
         f_yx = f_xy
         return f_xx, f_xy, f_yx, f_yy
 
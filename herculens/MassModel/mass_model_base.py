@@ -7,9 +7,11 @@
 __author__ = 'sibirrer', 'austinpeel', 'aymgal'
 
 
-from herculens.MassModel.Profiles import (gaussian_potential, point_mass, multipole,
-                                           shear, sie, sis, nie, epl, pixelated)
-from herculens.Util import util
+import importlib
+import jax
+import jax.numpy as jnp
+
+from herculens.Util.profile_list_base import ProfileListBase
 
 __all__ = ['MassModelBase']
 
@@ -20,10 +22,43 @@ SUPPORTED_MODELS = [
 ]
 
 
-# TODO: create parent for methods shared between MassProfileBase and LightProfileBase
+# modules of herculens.MassModel.Profiles, imported only when a profile is first needed
+_profile_modules = {}
+
+
+def _profile_module(module_name):
+    if module_name not in _profile_modules:
+        _profile_modules[module_name] = importlib.import_module(
+            f'herculens.MassModel.Profiles.{module_name}')
+    return _profile_modules[module_name]
+
+
+def _pixelated_fixed_factory(kwargs_pixel_grid_fixed=None, **kwargs):
+    if kwargs_pixel_grid_fixed is None:
+        raise ValueError("At least one pixel grid must be provided to use 'PIXELATED_FIXED' profile")
+    return _profile_module('pixelated').PixelatedFixed(**kwargs_pixel_grid_fixed)
 
 
-class MassModelBase(object):
+# Factories of the lens profiles, all taking the same keyword arguments as `MassModelBase._import_class`
+_MODEL_REGISTRY = {
+    'GAUSSIAN': lambda **kwargs: _profile_module('gaussian_potential').Gaussian(),
+    'SHEAR': lambda **kwargs: _profile_module('shear').Shear(),
+    'SHEAR_GAMMA_PSI': lambda **kwargs: _profile_module('shear').ShearGammaPsi(),
+    'POINT_MASS': lambda **kwargs: _profile_module('point_mass').PointMass(),
+    'NIE': lambda **kwargs: _profile_module('nie').NIE(),
+    'SIE': lambda **kwargs: _profile_module('sie').SIE(),
+    'SIS': lambda **kwargs: _profile_module('sis').SIS(),
+    'EPL': lambda no_complex_numbers=None, **kwargs: _profile_module('epl').EPL(
+        no_complex_numbers=no_complex_numbers),
+    'MULTIPOLE': lambda **kwargs: _profile_module('multipole').Multipole(),
+    'PIXELATED': lambda pixel_derivative_type=None, pixel_interpol=None, **kwargs: _profile_module('pixelated').PixelatedPotential(
+        derivative_type=pixel_derivative_type, interpolation_type=pixel_interpol),
+    'PIXELATED_DIRAC': lambda **kwargs: _profile_module('pixelated').PixelatedPotentialDirac(),
+    'PIXELATED_FIXED': _pixelated_fixed_factory,
+}
+
+
+class MassModelBase(ProfileListBase):
     """Base class for managing lens models in single- or multi-plane lensing."""
     def __init__(self, lens_model_list, 
                  kwargs_pixelated=None, 
@@ -39,25 +74,26 @@ class MassModelBase(object):
             Lens model profile types or classes.
 
         """
+        self._model_list = self._build_model_name_list(lens_model_list)
         self.func_list, self._pix_idx = self._load_model_instances(
             lens_model_list, pixel_derivative_type, pixel_interpol, 
             no_complex_numbers, kwargs_pixel_grid_fixed
         )
+        self._func_types = self._model_list
         self._num_func = len(self.func_list)
-        self._model_list = self.create_model_list(lens_model_list)
         if kwargs_pixelated is None:
             kwargs_pixelated = {}
         self._kwargs_pixelated = kwargs_pixelated
+        self._selected_funcs_cache = {}
+        self._selected_groups_cache = {}
         
-    def create_model_list(self, lens_model_list):
-        for i in range(len(lens_model_list)):
-            if isinstance(lens_model_list[i], type):
-                lens_model_list[i] = lens_model_list[i].__name__
-            elif isinstance(lens_model_list[i], str):
-                pass
-            else:
-                raise ValueError("lens_model_list must be a list of strings or classes")
-        return lens_model_list
+    @staticmethod
+    def _build_model_name_list(lens_model_list):
+        """Returns a new list with the names of the profiles, leaving the input list untouched."""
+        if not all(isinstance(lens_type, (str, type)) for lens_type in lens_model_list):
+            raise ValueError("lens_model_list must be a list of strings or classes")
+        return [lens_type.__name__ if isinstance(lens_type, type) else lens_type
+                for lens_type in lens_model_list]
 
     def _load_model_instances(self, 
             lens_model_list, pixel_derivative_type, pixel_interpol, 
@@ -92,42 +128,41 @@ class MassModelBase(object):
             no_complex_numbers=None, kwargs_pixel_grid_fixed=None
         ):
         """Get the lens profile class of the corresponding type."""
-        if lens_type == 'GAUSSIAN':
-            return gaussian_potential.Gaussian()
-        elif lens_type == 'SHEAR':
-            return shear.Shear()
-        elif lens_type == 'SHEAR_GAMMA_PSI':
-            return shear.ShearGammaPsi()
-        elif lens_type == 'POINT_MASS':
-            return point_mass.PointMass()
-        elif lens_type == 'NIE':
-            return nie.NIE()
-        elif lens_type == 'SIE':
-            return sie.SIE()
-        elif lens_type == 'SIS':
-            return sis.SIS()
-        elif lens_type == 'EPL':
-            return epl.EPL(no_complex_numbers=no_complex_numbers)
-        elif lens_type == 'MULTIPOLE':
-            return multipole.Multipole()
-        elif lens_type == 'PIXELATED':
-            return pixelated.PixelatedPotential(derivative_type=pixel_derivative_type, interpolation_type=pixel_interpol)
-        elif lens_type == 'PIXELATED_DIRAC':
-            return pixelated.PixelatedPotentialDirac()
-        elif lens_type == 'PIXELATED_FIXED':
-            if kwargs_pixel_grid_fixed is None:
-                raise ValueError("At least one pixel grid must be provided to use 'PIXELATED_FIXED' profile")
-            return pixelated.PixelatedFixed(**kwargs_pixel_grid_fixed)
         # Check if the lens is actually a class instead of a string
-        elif isinstance(lens_type, type):
+        if isinstance(lens_type, type):
             return lens_type()
-        else:
+        factory = _MODEL_REGISTRY.get(lens_type, None)
+        if factory is None:
             err_msg = (f"{lens_type} is not a valid lens model. " +
                        f"Supported types are {SUPPORTED_MODELS}")
             raise ValueError(err_msg)
+        return factory(
+            pixel_derivative_type=pixel_derivative_type, pixel_interpol=pixel_interpol, 
+            no_complex_numbers=no_complex_numbers, kwargs_pixel_grid_fixed=kwargs_pixel_grid_fixed,
+        )
+
+    @staticmethod
+    def _evaluate_stacked(method, x, y, stacked_kwargs):
+        """
+        Evaluates the method of a profile for stacked keyword arguments at once,
+        by vectorizing over the first axis, and returns the sum over that axis.
+        """
+        outputs = jax.vmap(lambda kwargs: method(x, y, **kwargs))(stacked_kwargs)
+        return jax.tree_util.tree_map(lambda out: jnp.sum(out, axis=0), outputs)
 
-    def _bool_list(self, k):
-        return util.convert_bool_list(n=self._num_func, k=k)
+    def _sum_profiles(self, method_name, x, y, kwargs, k, zeros):
+        """
+        Sums the outputs of the given method over the selected profiles.
+        Profiles of the same type are evaluated with a single vectorized call.
+        """
+        outputs = []
+        for func, _, kwargs_profile, is_stacked in self.group_by_type(kwargs, k=k):
+            method = getattr(func, method_name)
+            if is_stacked:
+                outputs.append(self._evaluate_stacked(method, x, y, kwargs_profile))
+            else:
+                outputs.append(method(x, y, **kwargs_profile))
+        return jax.tree_util.tree_map(lambda *out: sum(out[1:], out[0]), zeros, *outputs)
 
     @property
     def has_pixels(self):
@@ -6,12 +6,104 @@
 __author__ = 'austinpeel', 'gvernard', 'aymgal'
 
 
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
-from scipy import sparse, linalg
-import findiff
+from scipy import sparse, linalg, fft
+from scipy.sparse.linalg import LinearOperator
 
 from utax.interpolation import BicubicInterpolator as Interpolator
-from herculens.Util import util
+
+
+# most recently built convolution matrices, keyed by kernel content and image shape
+_conv_matrix_cache = OrderedDict()
+_conv_matrix_cache_size = 8
+
+
+def build_convolution_matrix(kernel_2d, image_shape):
+    """
+    Build a sparse matrix to convolve an image via matrix-vector product.
+    The matrices built for the last few kernels and image shapes are cached;
+    a copy is returned such that callers may modify it in place.
+
+    :param kernel_2d: 2D array of the convolution kernel, with sides smaller than the image
+    :param image_shape: shape of the image to be convolved
+    :return: scipy.sparse.csr_matrix of shape (num_pix, num_pix), with num_pix the number of image pixels
+    """
+    kernel_2d = np.asarray(kernel_2d)
+    key = (hashlib.blake2b(kernel_2d.tobytes()).digest(), kernel_2d.shape,
+           kernel_2d.dtype.str, tuple(image_shape))
+    if key in _conv_matrix_cache:
+        _conv_matrix_cache.move_to_end(key)
+        return _conv_matrix_cache[key].copy()
+    conv_matrix = _build_convolution_matrix(kernel_2d, image_shape)
+    _conv_matrix_cache[key] = conv_matrix
+    if len(_conv_matrix_cache) > _conv_matrix_cache_size:
+        _conv_matrix_cache.popitem(last=False)
+    return conv_matrix.copy()
+
+
+def _build_convolution_matrix(kernel_2d, image_shape):
+    """
+    Build a sparse matrix to convolve an image via matrix-vector product.
+    Equivalent to the matrix built by `utax.convolution.functions.build_convolution_matrix`
+    (ported from VKL, Vernardos & Koopmans 2022), but assembled as the sum over kernel rows
+    of Kronecker products between a row-shift matrix and a banded Toeplitz matrix
+    holding that kernel row, instead of looping over image pixels.
+    """
+    num_rows, num_cols = image_shape
+    num_pix = num_rows * num_cols
+    center_row, center_col = kernel_2d.shape[0] // 2, kernel_2d.shape[1] // 2
+    col_offsets = center_col - np.arange(kernel_2d.shape[1])
+    rows, cols, values = [], [], []
+    for ki, kernel_row in enumerate(kernel_2d):
+        # output row i receives the flux of input row i - (ki - center_row)
+        shift = sparse.eye(num_rows, k=center_row - ki)
+        toeplitz = sparse.diags(kernel_row, col_offsets, shape=(num_cols, num_cols))
+        block = sparse.kron(shift, toeplitz, format='coo')
+        rows.append(block.row)
+        cols.append(block.col)
+        values.append(block.data)
+    # all blocks are combined at once when converting to CSR
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(num_pix, num_pix))
+
+
+def build_convolution_operator(kernel_2d, image_shape):
+    """
+    Build a linear operator with the same action as the matrix returned by
+    `build_convolution_matrix()`, but without ever materializing it: products
+    (and products with its transpose) are computed via FFTs of the image,
+    reusing the Fourier transform of the kernel computed once here.
+
+    :param kernel_2d: 2D array of the convolution kernel, with sides smaller than the image
+    :param image_shape: shape of the image to be convolved
+    :return: scipy.sparse.linalg.LinearOperator of shape (num_pix, num_pix)
+    """
+    kernel_2d = np.asarray(kernel_2d)
+    num_rows, num_cols = image_shape
+    num_pix = num_rows * num_cols
+    center_row, center_col = kernel_2d.shape[0] // 2, kernel_2d.shape[1] // 2
+    # padded shape such that the circular convolution does not wrap around
+    fft_shape = tuple(fft.next_fast_len(n + k - 1, real=True)
+                      for n, k in zip(image_shape, kernel_2d.shape))
+    kernel_fft = fft.rfft2(kernel_2d, s=fft_shape)
+
+    def matvec(vector):
+        image_fft = fft.rfft2(vector.reshape(image_shape), s=fft_shape)
+        conv = fft.irfft2(image_fft * kernel_fft, s=fft_shape)
+        return conv[center_row:center_row+num_rows, center_col:center_col+num_cols].ravel()
+
+    def rmatvec(vector):
+        # correlation with the kernel, i.e. convolution with the flipped kernel
+        image_fft = fft.rfft2(vector.reshape(image_shape), s=fft_shape)
+        corr = fft.irfft2(image_fft * np.conj(kernel_fft), s=fft_shape)
+        corr = np.roll(corr, (center_row, center_col), axis=(0, 1))
+        return corr[:num_rows, :num_cols].ravel()
+
+    return LinearOperator((num_pix, num_pix), matvec=matvec, rmatvec=rmatvec,
+                          dtype=kernel_2d.dtype)
 
 
 def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out, 
@@ -35,13 +127,11 @@ def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out,
     x_dir = -1 if x_coord[0] > x_coord[-1] else 1  # Handle x-axis inversion
     x_lower = x_coord[0] - x_dir * half_pix
     x_upper = x_coord[-1] + x_dir * half_pix
-    xbins = np.linspace(x_lower, x_upper, num_pix + 1)
 
     y_coord = y_grid_1d_in[::num_pix]
     y_dir = -1 if y_coord[0] > y_coord[-1] else 1  # Handle y-axis inversion
     y_lower = y_coord[0] - y_dir * half_pix
     y_upper = y_coord[-1] + y_dir * half_pix
-    ybins = np.linspace(y_lower, y_upper, num_pix + 1)
 
     # Keep only coordinates that fall within the output grid
     x_min, x_max = [x_lower, x_upper][::x_dir]
@@ -54,8 +144,9 @@ def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out,
         num_pix_out = len(x_grid_1d_out)
 
     # Find the (1D) output pixel that (x_grid_1d_out, y_grid_1d_out) falls in
-    index_x = np.digitize(x_grid_1d_out, xbins) - 1
-    index_y = np.digitize(y_grid_1d_out, ybins) - 1
+    # (the grid is regular, so the bin index follows directly from the coordinates)
+    index_x = np.clip(((x_grid_1d_out - x_lower) * x_dir / delta_pix).astype(np.intp), 0, num_pix - 1)
+    index_y = np.clip(((y_grid_1d_out - y_lower) * y_dir / delta_pix).astype(np.intp), 0, num_pix - 1)
     index_1 = index_x + index_y * num_pix
 
     # Compute distances between input and output grid points
@@ -63,20 +154,22 @@ def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out,
     dy = y_grid_1d_out - y_grid_1d_in[index_1]
 
     # Find the three other nearest pixels (may end up out of bounds)
-    index_2 = index_1 + x_dir * np.sign(dx).astype(int)
-    index_3 = index_1 + y_dir * np.sign(dy).astype(int) * num_pix
-    index_4 = index_2 + y_dir * np.sign(dy).astype(int) * num_pix
-
-    # Treat these index arrays as four sets stacked vertically
+    # (a zero offset keeps the same pixel, whose duplicate weight is then normalized out)
+    step_x = x_dir * np.sign(dx).astype(int)
+    step_y = y_dir * num_pix * np.sign(dy).astype(int)
+    index_2 = index_1 + step_x
+    index_3 = index_1 + step_y
+    index_4 = index_2 + step_y
+
+    # Treat these index arrays as four neighbours per output pixel, with
+    # the neighbours of each pixel stored contiguously in an (N, 4) layout
     # Prepare to mask out out-of-bounds pixels as well as repeats
     # The former is important for the csr_matrix to be generated correctly
     max_index = x_grid_1d_in.size - 1  # Upper index bound
-    mask = np.ones((4, num_pix_out), dtype=bool)  # Mask for the coordinates
+    col = np.stack([index_1, index_2, index_3, index_4], axis=1)
 
     # Mask out any neighboring pixels that end up out of bounds
-    mask[1, np.where((index_2 < 0) | (index_2 > max_index))[0]] = False
-    mask[2, np.where((index_3 < 0) | (index_3 > max_index))[0]] = False
-    mask[3, np.where((index_4 < 0) | (index_4 > max_index))[0]] = False
+    mask = (col >= 0) & (col <= max_index)  # Mask for the coordinates
 
     # Mask any repeated pixels (2 or 3x) arising from unlucky grid alignment
     # zero_dx = list(np.where(dx == 0)[0])
@@ -87,19 +180,18 @@ def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out,
     # mask[(repeat_row, repeat_col)] = False  # TODO: this leads to strange lines
 
     # Generate 2D indices of non-zero elements for the sparse matrix
-    row = np.tile(np.nonzero(selection)[0], (4, 1))
-    col = np.array([index_1, index_2, index_3, index_4])
+    row = np.broadcast_to(np.nonzero(selection)[0][:, None], (num_pix_out, 4))
 
     # Compute bilinear weights like in Treu & Koopmans (2004)
+    # (output coordinates are broadcast against the four neighbours
+    # and the weights updated in place, to avoid temporary (N, 4) arrays)
     col[~mask] = 0  # Avoid accessing values out of bounds
-    dist_x = (np.tile(x_grid_1d_out, (4, 1)) - x_grid_1d_in[col]) / delta_pix
-    dist_y = (np.tile(y_grid_1d_out, (4, 1)) - y_grid_1d_in[col]) / delta_pix
-    weight = (1 - np.abs(dist_x)) * (1 - np.abs(dist_y))
+    weight = 1 - np.abs(x_grid_1d_out[:, None] - x_grid_1d_in[col]) / delta_pix
+    weight *= 1 - np.abs(y_grid_1d_out[:, None] - y_grid_1d_in[col]) / delta_pix
 
     # Make sure the weights are properly normalized
     # This step is only necessary where the mask has excluded source pixels
-    norm = np.expand_dims(np.sum(weight, axis=0, where=mask), 0)
-    weight = weight / norm
+    weight /= np.sum(weight, axis=1, where=mask, keepdims=True)
 
     if warning:
         if np.any(weight[mask] < 0):
@@ -114,8 +206,14 @@ def build_bilinear_interpol_matrix(x_grid_1d_in, y_grid_1d_in, x_grid_1d_out,
     return interpol_matrix, interpol_norm
 
 
-def build_DsD_matrix(smooth_lens_image, smooth_kwargs_params, hybrid_lens_image=None):
-    """this functions build the full operator from Koopmans 2005"""
+def build_DsD_matrix(smooth_lens_image, smooth_kwargs_params, hybrid_lens_image=None,
+                     as_operator=False):
+    """
+    this functions build the full operator from Koopmans 2005
+
+    :param as_operator: if True, the operator is returned as a scipy LinearOperator
+    that applies the derivatives and scales them on-the-fly, instead of a CSR matrix
+    """
     # data grid
     # x_coords, y_coords = smooth_lens_image.Grid.pixel_axes
     x_grid, y_grid = smooth_lens_image.Grid.pixel_coordinates
@@ -127,9 +225,11 @@ def build_DsD_matrix(smooth_lens_image, smooth_kwargs_params, hybrid_lens_image=
     # x_grid_pot, y_grid_pot = hybrid_lens_image.Grid.model_pixel_coordinates('lens')
 
     # numerics grid, for intermediate computation on a higher resolution grid
+    # (the flat coordinates are reshaped without copy, using the known grid shape)
+    num_grid_axes = smooth_lens_image.ImageNumerics.grid_class.num_grid_points_axes
     x_grid_num, y_grid_num = smooth_lens_image.ImageNumerics.coordinates_evaluate
-    x_grid_num = util.array2image(x_grid_num)
-    y_grid_num = util.array2image(y_grid_num)
+    x_grid_num = x_grid_num.reshape(num_grid_axes)
+    y_grid_num = y_grid_num.reshape(num_grid_axes)
     x_coords_num, y_coords_num = x_grid_num[0, :], y_grid_num[:, 0]
     # pixel_width_num = np.abs(x_coords_num[1] - x_coords_num[0])
     
@@ -161,23 +261,59 @@ def build_DsD_matrix(smooth_lens_image, smooth_kwargs_params, hybrid_lens_image=
     grad_s_x *= pixel_width**2
     grad_s_y *= pixel_width**2
 
-    # put them into sparse diagonal matrices
-    D_s_x = sparse.diags([grad_s_x.flatten()], [0])
-    D_s_y = sparse.diags([grad_s_y.flatten()], [0])
-
     # compute the potential derivative operator as two matrices D_x, D_y
-    step_size = pixel_width # step size
-    order = 1 # first-order derivative
-    accuracy = 2 # accuracy of the finite difference scheme (2-points, 4-points, etc.)
-    d_dx_class = findiff.FinDiff(1, step_size, order, acc=accuracy)
-    d_dy_class = findiff.FinDiff(0, step_size, order, acc=accuracy)
-    D_x = d_dx_class.matrix((num_pix_x, num_pix_y))
-    D_y = d_dy_class.matrix((num_pix_x, num_pix_y))  # sparse matrices
+    D_x, D_y = _gradient_matrices(num_pix_x, num_pix_y, pixel_width)
     
     # join the source and potential derivatives operators
-    # through minus their 'scalar' product (Eq. A6 from Koopmans 2005)
-    DsD = - D_s_x.dot(D_x) - D_s_y.dot(D_y)
+    # through minus their 'scalar' product (Eq. A6 from Koopmans 2005);
+    # left-multiplying by the diagonal matrices D_s_x, D_s_y amounts to scaling the rows
+    if as_operator:
+        grad_s_x_flat = np.ravel(np.asarray(grad_s_x))
+        grad_s_y_flat = np.ravel(np.asarray(grad_s_y))
+
+        def matvec(vector):
+            vector = np.ravel(vector)
+            return - grad_s_x_flat * D_x.dot(vector) - grad_s_y_flat * D_y.dot(vector)
+
+        def rmatvec(vector):
+            vector = np.ravel(vector)
+            return - D_x.T.dot(grad_s_x_flat * vector) - D_y.T.dot(grad_s_y_flat * vector)
+
+        DsD = LinearOperator(D_x.shape, matvec=matvec, rmatvec=rmatvec, dtype=D_x.dtype)
+    else:
+        DsD = - _scale_rows(D_x, grad_s_x) - _scale_rows(D_y, grad_s_y)
 
     # we also return the gradient of the source after being ray-traced to the data grid
     return DsD, grad_s_x, grad_s_y
 
+
+def _gradient_matrices(num_pix_x, num_pix_y, step_size):
+    """
+    Sparse matrices D_x, D_y of the derivatives along axis 1 and axis 0 of a flattened
+    array of shape (num_pix_x, num_pix_y), built as Kronecker products of 1D derivatives
+    (same stencils as `np.gradient(..., edge_order=2)`).
+    """
+    D_x = sparse.kron(sparse.eye(num_pix_x), _first_derivative_matrix(num_pix_y, step_size), format='csr')
+    D_y = sparse.kron(_first_derivative_matrix(num_pix_x, step_size), sparse.eye(num_pix_y), format='csr')
+    return D_x, D_y
+
+
+def _first_derivative_matrix(num_pix, step_size):
+    """
+    Sparse matrix of the 1D first-order derivative, using second-order central
+    differences, and second-order one-sided differences on both ends
+    (same as `findiff.FinDiff(0, step_size, 1, acc=2).matrix((num_pix,))`).
+    """
+    ones = np.ones(num_pix - 1)
+    D = sparse.diags([-ones, ones], [-1, 1], shape=(num_pix, num_pix), format='lil')
+    D[0, :3] = [-3., 4., -1.]
+    D[-1, -3:] = [1., -4., 3.]
+    return D.tocsr() / (2. * step_size)
+
+
+def _scale_rows(matrix, scale):
+    """Equivalent to `sparse.diags(scale.flatten()).dot(matrix)` for a CSR matrix."""
+    row_indices = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    scale = np.ravel(np.asarray(scale))
+    return sparse.csr_matrix((matrix.data * scale[row_indices], matrix.indices, matrix.indptr),
+                             shape=matrix.shape)
@@ -0,0 +1,95 @@
+# Selection and grouping of the profiles of a mass or light model
+#
+# Copyright (c) 2023, herculens developers and contributors
+
+__author__ = 'aymgal'
+
+
+import numpy as np
+import jax.numpy as jnp
+
+from herculens.Util import util
+
+__all__ = ['ProfileListBase']
+
+
+class ProfileListBase(object):
+    """
+    Parent class for methods shared between MassModelBase and LightModelBase.
+    Subclasses must set the following attributes: func_list (profile instances),
+    _func_types (profile type names), _num_func, _pix_idx (index of the pixelated profile or None)
+    and the empty dicts _selected_funcs_cache and _selected_groups_cache.
+    """
+
+    def _bool_list(self, k):
+        return util.convert_bool_list(n=self._num_func, k=k)
+
+    @staticmethod
+    def _selection_key(k):
+        return k if k is None or isinstance(k, (int, np.integer)) else tuple(k)
+
+    def _selected_funcs(self, k):
+        """
+        Returns a tuple of (index, profile) pairs for the profiles selected by k.
+        As k is static, this is computed once per selection such that only
+        the selected profiles are traced.
+        """
+        key = self._selection_key(k)
+        if key not in self._selected_funcs_cache:
+            bool_list = self._bool_list(k)
+            self._selected_funcs_cache[key] = tuple(
+                (i, func) for i, func in enumerate(self.func_list) if bool_list[i]
+            )
+        return self._selected_funcs_cache[key]
+
+    def _selected_groups(self, k):
+        """
+        Same as _selected_funcs(), but selected profiles of the same type
+        are grouped together, as a tuple of (profile, indices) pairs.
+        The pixelated profile is always kept in a group of its own.
+        """
+        key = self._selection_key(k)
+        if key not in self._selected_groups_cache:
+            groups = {}
+            for i, func in self._selected_funcs(k):
+                group_key = i if i == self._pix_idx else self._func_types[i]
+                groups.setdefault(group_key, (func, []))[1].append(i)
+            self._selected_groups_cache[key] = tuple(
+                (func, tuple(indices)) for func, indices in groups.values()
+            )
+        return self._selected_groups_cache[key]
+
+    def group_by_type(self, kwargs_list, k=None):
+        """
+        Groups the keyword arguments of the selected profiles by profile type.
+        For a given type, keyword arguments are stacked in a structure-of-arrays layout,
+        i.e. a single dict holding arrays of shape (num_profiles, ...) for each parameter.
+
+        :param kwargs_list: list of keyword arguments matching the profiles
+        :param k: selection of the profiles
+        :return: list of (profile, indices, kwargs, is_stacked) tuples; profiles that cannot be
+        stacked (single profile of its type, or different parameter names or shapes) are not grouped
+        """
+        groups = []
+        for func, indices in self._selected_groups(k):
+            kwargs_group = [kwargs_list[i] for i in indices]
+            stacked_kwargs = self._stack_kwargs(kwargs_group) if len(indices) > 1 else None
+            if stacked_kwargs is not None:
+                groups.append((func, indices, stacked_kwargs, True))
+            else:
+                groups.extend((func, (i,), kw, False) for i, kw in zip(indices, kwargs_group))
+        return groups
+
+    @staticmethod
+    def _stack_kwargs(kwargs_list):
+        """Stacks the values of a list of keyword arguments, or returns None if they are not compatible."""
+        keys = kwargs_list[0].keys()
+        if any(kwargs.keys() != keys for kwargs in kwargs_list[1:]):
+            return None
+        stacked_kwargs = {}
+        for key in keys:
+            values = [jnp.asarray(kwargs[key]) for kwargs in kwargs_list]
+            if any(value.shape != values[0].shape for value in values[1:]):
+                return None
+            stacked_kwargs[key] = jnp.stack(values)
+        return stacked_kwargs
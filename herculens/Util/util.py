@@ -249,11 +249,11 @@ def convert_bool_list(n, k=None):
         bool_list[k] = True
     elif len(k) == 0:  # empty list
         bool_list = [False] * n
-    elif isinstance(k[0], bool):
+    elif isinstance(k[0], (bool, np.bool_)):
         if n != len(k):
             raise ValueError('length of selected lens models in format of boolean list is %s '
                              'and does not match the models of this class instance %s.' % (len(k), n))
-        bool_list = k
+        bool_list = [bool(k_i) for k_i in k]
     elif isinstance(k[0], (int, np.integer)):  # list of integers
         bool_list = [False] * n
         for i, k_i in enumerate(k):
@@ -23,7 +23,6 @@ __requires__ = [
     'optax>=0.1.0',
     'chex>=0.1.4',
     'matplotlib>=3.0.0',
-    'findiff==0.8.9',
 ]  # Package dependencies
 
 # Default package properties
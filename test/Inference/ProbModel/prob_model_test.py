@@ -3,11 +3,19 @@
 # Copyright (c) 2023, herculens developers and contributors
 
 
+import numpy as np
+import jax
+import jax.numpy as jnp
+import numpy.testing as npt
 import numpyro
 import numpyro.distributions as dist
+from numpyro import handlers
+from numpyro.contrib.control_flow import scan
 from numpyro.distributions import constraints
+from numpyro.infer import util
 
 from herculens.Inference.ProbModel.numpyro import NumpyroModel
+from herculens.Inference.ProbModel import numpyro_util
 
 
 def test_num_parameters_numpyro():
@@ -59,3 +67,146 @@ def test_num_parameters_numpyro():
     prob_model = MyProbModel()
 
     assert prob_model.num_parameters == 22
+
+
+def test_site_transforms_numpyro():
+
+    class MyProbModel(NumpyroModel):
+
+        def model(self):
+            x = numpyro.sample('x', dist.Normal(0., 1.))
+            y = numpyro.sample('y', dist.Uniform(-1., 2.))
+            z = numpyro.sample('z', dist.LogNormal(0., 0.5))
+            w = numpyro.param('w', 0.5, constraint=constraints.positive)
+            numpyro.sample('obs', dist.Normal(x + y * z, w), obs=1.)
+
+    prob_model = MyProbModel()
+    assert set(prob_model.site_transforms.keys()) == {'x', 'y', 'z', 'w'}
+    is_identity = {name: st[2] for name, st in prob_model.site_transforms.items()}
+    assert is_identity == {'x': True, 'y': False, 'z': False, 'w': False}
+
+    params = {'x': 0.3, 'y': -0.2, 'z': 0.1, 'w': -0.4}
+    log_prob_cached = prob_model.log_prob(params)
+    log_prob_ref = - numpyro_util.potential_energy(prob_model.model, (), {}, params)
+    npt.assert_allclose(log_prob_cached, log_prob_ref, rtol=1e-6)
+
+    params_const = prob_model.constrain(params)
+    npt.assert_allclose(params_const['y'], -1. + 3. / (1. + np.exp(0.2)), rtol=1e-6)
+    npt.assert_allclose(params_const['w'], np.exp(-0.4), rtol=1e-6)
+    params_unconst = prob_model.unconstrain(params_const)
+    for name in params:
+        npt.assert_allclose(params_unconst[name], params[name], rtol=1e-5, atol=1e-6)
+
+
+def test_site_transforms_jit_numpyro():
+
+    class MyProbModel(NumpyroModel):
+
+        def model(self):
+            x = numpyro.sample('x', dist.Uniform(jnp.array(-1.) * 2, jnp.exp(1.)))
+            numpyro.sample('obs', dist.Normal(x, 1.), obs=0.5)
+
+    prob_model = MyProbModel()
+    params = {'x': 0.1}
+    # transforms first built within a jitted function can be reused outside of it
+    log_prob_jit = jax.jit(prob_model.log_prob)(params)
+    npt.assert_allclose(prob_model.log_prob(params), log_prob_jit, rtol=1e-6)
+    params_const_jit = jax.jit(prob_model.constrain)(params)
+    npt.assert_allclose(prob_model.constrain(params)['x'], params_const_jit['x'], rtol=1e-6)
+
+
+class DependentSupportModel(NumpyroModel):
+
+    def model(self):
+        a = numpyro.sample('a', dist.Uniform(0., 1.))
+        b = numpyro.sample('b', dist.Uniform(a - 0.1, a + 0.1))
+        numpyro.sample('obs', dist.Normal(a + b, 0.1), obs=1.)
+
+
+def test_site_transforms_dependent_support_numpyro():
+    prob_model = DependentSupportModel()
+    # the support of b depends on the value of a, so its transform is not precomputed
+    assert prob_model.site_transforms['a'] is not None
+    assert prob_model.site_transforms['b'] is None
+    params = {'a': 0.5, 'b': -0.3}
+    log_prob_ref = - util.potential_energy(prob_model.model, (), {}, params)
+    npt.assert_allclose(prob_model.log_prob(params), log_prob_ref, rtol=1e-6)
+    npt.assert_allclose(jax.jit(prob_model.log_prob)(params), log_prob_ref, rtol=1e-6)
+
+
+def test_constrain_dependent_support_numpyro():
+    prob_model = DependentSupportModel()
+    params = {'a': 0.5, 'b': -0.3}
+    params_const_ref = util.constrain_fn(prob_model.model, (), {}, params)
+    params_const = prob_model.constrain(params)
+    for name in params:
+        npt.assert_allclose(params_const[name], params_const_ref[name], rtol=1e-6)
+        npt.assert_allclose(numpyro_util.constrain_fn(prob_model.model, (), {}, params)[name],
+                            params_const_ref[name], rtol=1e-6)
+    params_unconst = prob_model.unconstrain(params_const)
+    for name in params:
+        npt.assert_allclose(params_unconst[name], params[name], rtol=1e-5, atol=1e-6)
+
+
+def test_constrain_fn_model_args_numpyro():
+
+    def model(high):
+        numpyro.sample('x', dist.Uniform(0., high))
+
+    params = {'x': 0.}
+    npt.assert_allclose(numpyro_util.constrain_fn(model, (1.,), {}, params)['x'], 0.5, rtol=1e-6)
+    npt.assert_allclose(numpyro_util.constrain_fn(model, (3.,), {}, params)['x'], 1.5, rtol=1e-6)
+
+
+def test_potential_energy_numpyro():
+
+    def model():
+        x = numpyro.sample('x', dist.Normal(0., 1.))
+        y = numpyro.sample('y', dist.Uniform(-1., 2.))
+        z = numpyro.sample('z', dist.LogNormal(0., 0.5))
+        with numpyro.plate('plate', 3):
+            t = numpyro.sample('t', dist.HalfNormal(1.))
+        numpyro.sample('obs', dist.Normal(x + y * z + t.sum(), 0.5), obs=1.)
+
+    params = {'x': 0.3, 'y': -0.2, 'z': 0.1, 't': np.array([0.1, -0.2, 0.3])}
+    site_transforms = numpyro_util.build_site_transforms(model, (), {})
+    potential_ref = util.potential_energy(model, (), {}, params)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params),
+                        potential_ref, rtol=1e-6)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params, site_transforms=site_transforms),
+                        potential_ref, rtol=1e-6)
+
+
+def test_potential_energy_scan_numpyro():
+
+    def model():
+        def transition(carry, _):
+            s = numpyro.sample('s', dist.LogNormal(carry, 0.5))
+            return s, s
+        scan(transition, 0., None, length=3)
+        numpyro.sample('obs', dist.Normal(0., 1.), obs=1.)
+
+    params = {'s': jnp.array([0.1, -0.2, 0.3])}
+    site_transforms = numpyro_util.build_site_transforms(model, (), {})
+    potential_ref = util.potential_energy(model, (), {}, params)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params),
+                        potential_ref, rtol=1e-6)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params, site_transforms=site_transforms),
+                        potential_ref, rtol=1e-6)
+
+
+def test_potential_energy_mask_numpyro():
+
+    def model():
+        x = numpyro.sample('x', dist.LogNormal(0., 1.))
+        with handlers.mask(mask=False):
+            numpyro.sample('y', dist.HalfNormal(1.))
+        numpyro.sample('obs', dist.Normal(x, 1.), obs=1.)
+
+    params = {'x': 0.2, 'y': -0.4}
+    site_transforms = numpyro_util.build_site_transforms(model, (), {})
+    potential_ref = util.potential_energy(model, (), {}, params)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params),
+                        potential_ref, rtol=1e-6)
+    npt.assert_allclose(numpyro_util.potential_energy(model, (), {}, params, site_transforms=site_transforms),
+                        potential_ref, rtol=1e-6)
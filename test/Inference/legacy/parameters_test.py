@@ -0,0 +1,119 @@
+# Testing the legacy Parameters class
+# 
+# Copyright (c) 2023, herculens developers and contributors
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+
+from herculens.Coordinates.pixel_grid import PixelGrid
+from herculens.Instrument.psf import PSF
+from herculens.LightModel.light_model import LightModel
+from herculens.MassModel.mass_model import MassModel
+from herculens.LensImage.lens_image import LensImage
+from herculens.Inference.legacy.parameters import Parameters
+
+
+def _lens_image(mass_model_list, source_model_list, lens_light_model_list,
+                kwargs_pixelated=None, shapelets_n_max=4):
+    npix, pix_scl = 10, 0.1
+    half_size = npix * pix_scl / 2.
+    pixel_grid = PixelGrid(nx=npix, ny=npix, transform_pix2angle=pix_scl * np.eye(2),
+                           ra_at_xy_0=-half_size + pix_scl / 2., dec_at_xy_0=-half_size + pix_scl / 2.)
+    psf = PSF(psf_type='GAUSSIAN', fwhm=0.3, pixel_size=pix_scl)
+    return LensImage(pixel_grid, psf,
+                     lens_mass_model_class=MassModel(mass_model_list),
+                     source_model_class=LightModel(source_model_list, kwargs_pixelated=kwargs_pixelated),
+                     lens_light_model_class=LightModel(lens_light_model_list,
+                                                       shapelets_n_max=shapelets_n_max))
+
+
+def _parameters():
+    lens_image = _lens_image(['SIE'], ['PIXELATED'], ['SERSIC_ELLIPSE'],
+                             kwargs_pixelated={'num_pixels': 4})
+    kwargs_init = {
+        'kwargs_lens': [{'theta_E': 1., 'e1': 0., 'e2': 0., 'center_x': 0., 'center_y': 0.}],
+        'kwargs_source': [{'pixels': 1.}],
+        'kwargs_lens_light': [{'amp': 5., 'R_sersic': 1., 'n_sersic': 2., 
+                               'e1': 0., 'e2': 0., 'center_x': 0., 'center_y': 0.}],
+    }
+    kwargs_fixed = {
+        'kwargs_lens': [{'center_x': 0., 'center_y': 0.}],
+        'kwargs_source': [{}],
+        'kwargs_lens_light': [{'e1': 0., 'e2': 0., 'center_x': 0., 'center_y': 0.}],
+    }
+    # gaussian, uniform and unset priors
+    kwargs_prior = {
+        'kwargs_lens': [{'theta_E': ['gaussian', 1., 0.1], 'e1': ['uniform', -0.3, 0.3]}],
+        'kwargs_source': [{'pixels': ['uniform', 0., 10.]}],
+        'kwargs_lens_light': [{'amp': ['gaussian', 5., 2.], 'R_sersic': ['uniform', 0.1, 2.]}],
+    }
+    return Parameters(lens_image, kwargs_init, kwargs_fixed, kwargs_prior=kwargs_prior)
+
+
+def test_log_prior():
+    parameters = _parameters()
+    names = parameters.names
+    assert parameters.num_parameters == 3 + 16 + 3
+    assert parameters.prior_types.count('gaussian') == 2
+    assert parameters.prior_types.count('uniform') == 1 + 16 + 1
+    assert parameters.prior_types.count(None) == 2
+    args = np.array(parameters.initial_values())
+    # within the bounds, only the gaussian priors contribute
+    args[names.index('theta_E-lens-0')] = 1.2   # -0.5 * (0.2 / 0.1)**2 = -2
+    args[names.index('amp-lens_light-0')] = 4.  # -0.5 * (1 / 2)**2 = -0.125
+    args[names.index('e2-lens-0')] = 100.       # no prior
+    npt.assert_allclose(parameters.log_prior_gaussian(args), -2.125, rtol=1e-6)
+    npt.assert_allclose(parameters.log_prior_uniform(args), 0., atol=1e-8)
+    npt.assert_allclose(parameters.log_prior(args), -2.125, rtol=1e-6)
+    npt.assert_allclose(parameters.log_prior_nojit(args), -2.125, rtol=1e-6)
+    # two parameters out of their bounds
+    args[names.index('e1-lens-0')] = 0.5        # -(0.5 - 0.3)**2 = -0.04
+    args[names.index('s_3-source-0')] = -1.     # -(-1 - 0)**2 = -1
+    npt.assert_allclose(parameters.log_prior_gaussian(args), -2.125, rtol=1e-6)
+    npt.assert_allclose(parameters.log_prior_uniform(args), -1.04, rtol=1e-5)
+    log_prior_ref = -2.125 - 2 * Parameters._unif_prior_penalty
+    npt.assert_allclose(parameters.log_prior(args), log_prior_ref, rtol=1e-6)
+    npt.assert_allclose(parameters.log_prior_nojit(args), log_prior_ref, rtol=1e-6)
+
+
+def test_names_symbols():
+    lens_image = _lens_image(['SIE', 'SHEAR_GAMMA_PSI'], ['PIXELATED'], ['SERSIC'],
+                             kwargs_pixelated={'num_pixels': 2})
+    kwargs_init = {
+        'kwargs_lens': [{'theta_E': 1., 'e1': 0., 'e2': 0., 'center_x': 0., 'center_y': 0.},
+                        {'gamma_ext': 0.01, 'psi_ext': 0.1, 'ra_0': 0., 'dec_0': 0.}],
+        'kwargs_source': [{'pixels': 1.}],
+        'kwargs_lens_light': [{'amp': 5., 'R_sersic': 1., 'n_sersic': 2., 'center_x': 0., 'center_y': 0.}],
+    }
+    kwargs_fixed = {
+        'kwargs_lens': [{'e1': 0., 'e2': 0., 'center_x': 0., 'center_y': 0.}, {'ra_0': 0., 'dec_0': 0.}],
+        'kwargs_source': [{}],
+        'kwargs_lens_light': [{'R_sersic': 1., 'n_sersic': 2., 'center_x': 0., 'center_y': 0.}],
+    }
+    parameters = Parameters(lens_image, kwargs_init, kwargs_fixed)
+    assert parameters.names == ['theta_E-lens-0', 'gamma_ext-lens-1', 'psi_ext-lens-1',
+                                's_0-source-0', 's_1-source-0', 's_2-source-0', 's_3-source-0',
+                                'amp-lens_light-0']
+    assert parameters.symbols == [r"$\theta_{\rm E}$", r"$\gamma_{\rm ext}$", r"$\psi_{\rm ext}$",
+                                  r"$s_{0}$", r"$s_{1}$", r"$s_{2}$", r"$s_{3}$", r"$A$"]
+
+
+def test_names_symbols_shapelets():
+    pytest.importorskip('gigalens')
+    lens_image = _lens_image(['SHEAR_GAMMA_PSI'], [], ['SHAPELETS'], shapelets_n_max=1)
+    kwargs_init = {
+        'kwargs_lens': [{'gamma_ext': 0.01, 'psi_ext': 0.1, 'ra_0': 0., 'dec_0': 0.}],
+        'kwargs_source': [],
+        'kwargs_lens_light': [{'beta': 0.2, 'center_x': 0., 'center_y': 0., 'amps': np.ones(3)}],
+    }
+    kwargs_fixed = {
+        'kwargs_lens': [{'ra_0': 0., 'dec_0': 0.}],
+        'kwargs_source': [],
+        'kwargs_lens_light': [{'center_x': 0., 'center_y': 0.}],
+    }
+    parameters = Parameters(lens_image, kwargs_init, kwargs_fixed)
+    assert parameters.names == ['gamma_ext-lens-0', 'psi_ext-lens-0', 'beta-lens_light-0',
+                                'amp_0-lens_light-0', 'amp_1-lens_light-0', 'amp_2-lens_light-0']
+    assert parameters.symbols == [r"$\gamma_{\rm ext}$", r"$\psi_{\rm ext}$", r"$\beta$",
+                                  r"$A_{0}$", r"$A_{1}$", r"$A_{2}$"]
@@ -0,0 +1,119 @@
+# Testing convolution classes
+#
+# Copyright (c) 2023, herculens developers and contributors
+
+import pickle
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+
+from herculens.LensImage.Numerics.convolution import (PixelKernelConvolution,
+                                                     SubgridKernelConvolution,
+                                                     GaussianConvolution)
+
+
+@pytest.mark.parametrize(
+    "image_shape, kernel_shape, convolution_type",
+    [((20, 20), (5, 5), 'fft'), ((30, 24), (7, 9), 'fft'), ((15, 17), (4, 6), 'fft'),
+     ((20, 20), (5, 5), 'matrix'), ((30, 24), (7, 9), 'matrix'),
+     ((20, 20), (5, 5), 'jax_scipy'), ((15, 17), (4, 6), 'jax_scipy')]
+)
+def test_pixel_kernel_convolution(image_shape, kernel_shape, convolution_type):
+    rng = np.random.default_rng(18)
+    kernel = rng.random(kernel_shape)
+    kernel /= kernel.sum()
+    image = rng.random(image_shape)
+    reference = PixelKernelConvolution(kernel, convolution_type='jax_scipy_fft')
+    conv = PixelKernelConvolution(kernel, convolution_type=convolution_type,
+                                  output_shape=image_shape)
+    npt.assert_allclose(conv.convolution2d(image), reference.convolution2d(image),
+                        rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize("convolution_type", ['jax_scipy_fft', 'jax_scipy', 'fft', 'matrix'])
+def test_pixel_kernel_convolution_pickle(convolution_type):
+    rng = np.random.default_rng(18)
+    kernel = rng.random((5, 5))
+    image = rng.random((20, 20))
+    conv = PixelKernelConvolution(kernel, convolution_type=convolution_type, output_shape=(20, 20))
+    image_conv = conv.convolution2d(image)
+    conv_copy = pickle.loads(pickle.dumps(conv))
+    npt.assert_allclose(conv_copy.convolution2d(image), image_conv, rtol=1e-6)
+
+
+def test_pixel_kernel_convolution_requires_shape():
+    with pytest.raises(ValueError):
+        PixelKernelConvolution(np.ones((3, 3)), convolution_type='fft')
+
+
+@pytest.mark.parametrize("supersampling_factor", [1, 3])
+def test_gaussian_convolution_pixel_kernel(supersampling_factor):
+    conv = GaussianConvolution(0.3, 0.1, supersampling_factor=supersampling_factor,
+                               supersampling_convolution=supersampling_factor > 1)
+    kernel = conv.pixel_kernel(25)
+    npt.assert_allclose(kernel.sum(), 1., rtol=1e-6)
+    npt.assert_allclose(kernel, kernel.T, rtol=1e-6)
+    # on the image grid, convolving a delta function returns the pixel kernel
+    image = np.zeros((41, 41))
+    image[20, 20] = 1.
+    conv_1 = GaussianConvolution(0.3, 0.1, truncation=4)
+    npt.assert_allclose(conv_1.convolution2d(image)[8:33, 8:33], kernel, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "supersampling_factor, image_shape, kernel_size",
+    [(3, (12, 10), 15), (2, (50, 50), 11)]
+)
+@pytest.mark.parametrize("supersampling_kernel_size", [None, 3])
+def test_subgrid_kernel_convolution_fft(supersampling_factor, image_shape, kernel_size,
+                                        supersampling_kernel_size):
+    rng = np.random.default_rng(18)
+    kernel = rng.random((kernel_size, kernel_size))
+    kernel /= kernel.sum()
+    image_high_res = rng.random(tuple(n * supersampling_factor for n in image_shape))
+    reference = SubgridKernelConvolution(kernel, supersampling_factor,
+                                         supersampling_kernel_size=supersampling_kernel_size)
+    conv = SubgridKernelConvolution(kernel, supersampling_factor,
+                                    supersampling_kernel_size=supersampling_kernel_size,
+                                    convolution_type='fft', output_shape=image_shape)
+    npt.assert_allclose(conv.convolution2d(image_high_res), reference.convolution2d(image_high_res),
+                        rtol=1e-5, atol=1e-6)
+
+
+def test_subgrid_kernel_convolution_pickle():
+    rng = np.random.default_rng(18)
+    kernel = rng.random((15, 15))
+    image_high_res = rng.random((36, 30))
+    image_low_res = rng.random((12, 10))
+    conv = SubgridKernelConvolution(kernel, 3, supersampling_kernel_size=3,
+                                    convolution_type='fft', output_shape=(12, 10))
+    image_conv = conv.re_size_convolve(image_low_res, image_high_res)
+    conv_copy = pickle.loads(pickle.dumps(conv))
+    npt.assert_allclose(conv_copy.re_size_convolve(image_low_res, image_high_res), image_conv, rtol=1e-6)
+    npt.assert_allclose(conv_copy.convolution2d(image_high_res), conv.convolution2d(image_high_res), rtol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "image_shape, kernel_shape, expected_type",
+    [((20, 20), (3, 3), 'jax_scipy'), ((100, 100), (31, 31), 'fft')]
+)
+def test_pixel_kernel_convolution_auto(image_shape, kernel_shape, expected_type):
+    rng = np.random.default_rng(18)
+    kernel = rng.random(kernel_shape)
+    image = rng.random(image_shape)
+    reference = PixelKernelConvolution(kernel, convolution_type='jax_scipy_fft')
+    conv = PixelKernelConvolution(kernel, convolution_type='auto', output_shape=image_shape)
+    assert conv._conv_type == expected_type
+    npt.assert_allclose(conv.convolution2d(image), reference.convolution2d(image),
+                        rtol=1e-4, atol=1e-4)
+
+
+def test_gaussian_convolution_compute_dtype():
+    rng = np.random.default_rng(18)
+    image = rng.random((30, 30)).astype(np.float32)
+    conv = GaussianConvolution(0.3, 0.1, truncation=4)
+    conv_bf16 = GaussianConvolution(0.3, 0.1, truncation=4, compute_dtype='bfloat16')
+    image_conv_bf16 = conv_bf16.convolution2d(image)
+    assert image_conv_bf16.dtype == np.float32
+    npt.assert_allclose(image_conv_bf16, conv.convolution2d(image), rtol=2e-2)
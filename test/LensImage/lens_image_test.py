@@ -0,0 +1,63 @@
+# Testing the LensImage class
+#
+# Copyright (c) 2023, herculens developers and contributors
+
+import pickle
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+
+from herculens.Coordinates.pixel_grid import PixelGrid
+from herculens.Instrument.psf import PSF
+from herculens.Instrument.noise import Noise
+from herculens.LightModel.light_model import LightModel
+from herculens.MassModel.mass_model import MassModel
+from herculens.LensImage.lens_image import LensImage
+
+
+KWARGS_LENS = [{'theta_E': 0.6, 'e1': 0.1, 'e2': -0.05, 'center_x': 0., 'center_y': 0.},
+               {'gamma1': -0.03, 'gamma2': 0.02, 'ra_0': 0., 'dec_0': 0.}]
+KWARGS_LIGHT = [{'amp': 5.0, 'R_sersic': 0.2, 'n_sersic': 2., 'e1': -0.05, 'e2': 0.05,
+                 'center_x': 0.05, 'center_y': 0.1}]
+
+
+def _lens_image(kwargs_numerics):
+    npix, pix_scl = 20, 0.1
+    half_size = npix * pix_scl / 2.
+    pixel_grid = PixelGrid(nx=npix, ny=npix, transform_pix2angle=pix_scl * np.eye(2),
+                           ra_at_xy_0=-half_size + pix_scl / 2., dec_at_xy_0=-half_size + pix_scl / 2.)
+    psf = PSF(psf_type='GAUSSIAN', fwhm=0.3, pixel_size=pix_scl)
+    noise = Noise(npix, npix, background_rms=1e-2, exposure_time=1000.)
+    return LensImage(pixel_grid, psf, noise_class=noise,
+                     lens_mass_model_class=MassModel(['SIE', 'SHEAR']),
+                     source_model_class=LightModel(['SERSIC_ELLIPSE']),
+                     lens_light_model_class=LightModel(['SERSIC_ELLIPSE']),
+                     kwargs_numerics=kwargs_numerics)
+
+
+@pytest.mark.parametrize("kwargs_numerics", [
+    {'supersampling_factor': 1},
+    {'supersampling_factor': 3, 'convolution_type': 'fft'},
+])
+def test_lens_image_pickle(kwargs_numerics):
+    lens_image = _lens_image(kwargs_numerics)
+    kwargs_lens, kwargs_light = KWARGS_LENS, KWARGS_LIGHT
+    model = lens_image.model(kwargs_lens=kwargs_lens, kwargs_source=kwargs_light,
+                             kwargs_lens_light=kwargs_light)
+    # the instance can still be pickled once the model has been computed
+    lens_image_copy = pickle.loads(pickle.dumps(lens_image))
+    npt.assert_allclose(lens_image_copy.model(kwargs_lens=kwargs_lens, kwargs_source=kwargs_light,
+                                              kwargs_lens_light=kwargs_light),
+                        model, rtol=1e-6)
+
+
+@pytest.mark.parametrize("supersampled", [False, True])
+def test_empty_selection_shape(supersampled):
+    lens_image = _lens_image({'supersampling_factor': 3})
+    lens_light = lens_image.lens_surface_brightness(KWARGS_LIGHT, supersampled=supersampled)
+    lens_light_empty = lens_image.lens_surface_brightness(KWARGS_LIGHT, supersampled=supersampled, k=[False])
+    assert lens_light_empty.shape == lens_light.shape
+    source = lens_image.source_surface_brightness(KWARGS_LIGHT, KWARGS_LENS, supersampled=supersampled)
+    source_empty = lens_image.source_surface_brightness(KWARGS_LIGHT, KWARGS_LENS, supersampled=supersampled, k=[False])
+    assert source_empty.shape == source.shape
@@ -0,0 +1,59 @@
+# Testing light models
+# 
+# Copyright (c) 2023, herculens developers and contributors
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+import jax
+import jax.numpy as jnp
+
+from herculens.LightModel.light_model import LightModel
+
+
+KWARGS_LIGHT = [
+    {'amp': 5., 'R_sersic': 0.4, 'n_sersic': 2., 'e1': 0.1, 'e2': -0.05, 'center_x': 0.1, 'center_y': 0.},
+    {'amp': 2., 'sigma': 0.3, 'center_x': -0.5, 'center_y': 0.4},
+    {'amp': 1., 'R_sersic': 0.2, 'n_sersic': 3., 'e1': -0.1, 'e2': 0.02, 'center_x': -0.3, 'center_y': 0.2},
+    {'amp': 0.1},
+    {'amp': 3., 'sigma': 0.1, 'center_x': 0.8, 'center_y': -0.6},
+]
+LIGHT_MODEL_LIST = ['SERSIC_ELLIPSE', 'GAUSSIAN', 'SERSIC_ELLIPSE', 'UNIFORM', 'GAUSSIAN']
+
+
+@pytest.mark.parametrize("k", [None, (0, 1, 2, 4), (True, True, False, False, True)])
+def test_grouped_profiles(k):
+    light_model = LightModel(LIGHT_MODEL_LIST)
+    x, y = np.meshgrid(np.linspace(-2, 2, 11), np.linspace(-2, 2, 11))
+    x, y = x.flatten(), y.flatten()
+    # reference: sum of individual profiles
+    if k is None:
+        indices = range(len(LIGHT_MODEL_LIST))
+    elif isinstance(k[0], bool):
+        indices = [i for i, k_i in enumerate(k) if k_i]
+    else:
+        indices = k
+    flux_ref = sum(light_model.surface_brightness(x, y, KWARGS_LIGHT, k=i) for i in indices)
+    npt.assert_allclose(light_model.surface_brightness(x, y, KWARGS_LIGHT, k=k), flux_ref, rtol=1e-5, atol=1e-6)
+
+
+def test_group_by_type():
+    light_model = LightModel(LIGHT_MODEL_LIST)
+    groups = light_model.group_by_type(KWARGS_LIGHT)
+    assert len(groups) == 3
+    assert [is_stacked for _, _, _, is_stacked in groups] == [True, True, False]
+    assert [indices for _, indices, _, _ in groups] == [(0, 2), (1, 4), (3,)]
+    npt.assert_allclose(groups[1][2]['sigma'], [0.3, 0.1])
+
+
+def test_traced_selection():
+    light_model = LightModel(LIGHT_MODEL_LIST)
+    x, y = np.meshgrid(np.linspace(-2, 2, 11), np.linspace(-2, 2, 11))
+    x, y = x.flatten(), y.flatten()
+    surface_brightness = jax.jit(lambda k: light_model.surface_brightness(x, y, KWARGS_LIGHT, k=k))
+    for k in [(True, True, False, False, True), (False, True, True, True, False)]:
+        npt.assert_allclose(surface_brightness(jnp.array(k)),
+                            light_model.surface_brightness(x, y, KWARGS_LIGHT, k=k),
+                            rtol=1e-5, atol=1e-6)
+    # both selections share the same compiled function
+    assert surface_brightness._cache_size() == 1
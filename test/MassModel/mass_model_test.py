@@ -0,0 +1,48 @@
+# Testing mass models
+# 
+# Copyright (c) 2023, herculens developers and contributors
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+
+from herculens.MassModel.mass_model import MassModel
+
+
+KWARGS_LENS = [
+    {'theta_E': 1.2, 'e1': 0.1, 'e2': -0.05, 'center_x': 0.1, 'center_y': 0.},
+    {'theta_E': 0.3, 'e1': -0.1, 'e2': 0.02, 'center_x': -0.5, 'center_y': 0.4},
+    {'theta_E': 0.1, 'center_x': 0.8, 'center_y': -0.6},
+    {'gamma1': 0.03, 'gamma2': -0.01, 'ra_0': 0., 'dec_0': 0.},
+    {'theta_E': 0.05, 'center_x': -0.8, 'center_y': 0.7},
+]
+MASS_MODEL_LIST = ['SIE', 'SIE', 'POINT_MASS', 'SHEAR', 'POINT_MASS']
+
+
+@pytest.mark.parametrize("k", [None, (0, 1, 2, 4), (True, True, False, False, True)])
+def test_grouped_profiles(k):
+    mass_model = MassModel(MASS_MODEL_LIST)
+    x, y = np.meshgrid(np.linspace(-2, 2, 11), np.linspace(-2, 2, 11))
+    x, y = x.flatten(), y.flatten()
+    # reference: sum of individual profiles
+    if k is None:
+        indices = range(len(MASS_MODEL_LIST))
+    elif isinstance(k[0], bool):
+        indices = [i for i, k_i in enumerate(k) if k_i]
+    else:
+        indices = k
+    potential_ref = sum(mass_model.potential(x, y, KWARGS_LENS, k=i) for i in indices)
+    alpha_ref = [sum(a) for a in zip(*[mass_model.alpha(x, y, KWARGS_LENS, k=i) for i in indices])]
+    hessian_ref = [sum(h) for h in zip(*[mass_model.hessian(x, y, KWARGS_LENS, k=i) for i in indices])]
+    npt.assert_allclose(mass_model.potential(x, y, KWARGS_LENS, k=k), potential_ref, rtol=1e-5, atol=1e-6)
+    npt.assert_allclose(mass_model.alpha(x, y, KWARGS_LENS, k=k), alpha_ref, rtol=1e-5, atol=1e-6)
+    npt.assert_allclose(mass_model.hessian(x, y, KWARGS_LENS, k=k), hessian_ref, rtol=1e-5, atol=1e-6)
+
+
+def test_group_by_type():
+    mass_model = MassModel(MASS_MODEL_LIST)
+    groups = mass_model.group_by_type(KWARGS_LENS)
+    assert len(groups) == 3
+    assert [is_stacked for _, _, _, is_stacked in groups] == [True, True, False]
+    assert [indices for _, indices, _, _ in groups] == [(0, 1), (2, 4), (3,)]
+    npt.assert_allclose(groups[1][2]['theta_E'], [0.1, 0.05])
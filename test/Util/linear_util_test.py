@@ -0,0 +1,82 @@
+# Testing linear operators utilities
+# 
+# Copyright (c) 2023, herculens developers and contributors
+
+import pytest
+import numpy as np
+import numpy.testing as npt
+from scipy.signal import convolve2d
+
+from herculens.Util.linear_util import (build_convolution_matrix, build_convolution_operator,
+                                       _first_derivative_matrix, _gradient_matrices)
+
+
+@pytest.mark.parametrize(
+    "image_shape, kernel_size",
+    [((10, 10), 3), ((20, 20), 5), ((12, 16), 7)]
+)
+def test_build_convolution_matrix(image_shape, kernel_size):
+    rng = np.random.default_rng(18)
+    kernel = rng.random((kernel_size, kernel_size))
+    image = rng.random(image_shape)
+    conv_matrix = build_convolution_matrix(kernel, image_shape)
+    num_pix = image.size
+    assert conv_matrix.shape == (num_pix, num_pix)
+    image_conv = conv_matrix.dot(image.flatten()).reshape(image_shape)
+    npt.assert_allclose(image_conv, convolve2d(image, kernel, mode='same'), rtol=1e-10)
+
+
+def test_build_convolution_matrix_cache():
+    rng = np.random.default_rng(18)
+    kernel = rng.random((3, 3))
+    conv_matrix = build_convolution_matrix(kernel, (10, 10))
+    conv_matrix_ref = conv_matrix.toarray()
+    # modifying a returned matrix in place does not affect later calls
+    conv_matrix *= 2.
+    conv_matrix.data[0] = -1.
+    npt.assert_array_equal(build_convolution_matrix(kernel, (10, 10)).toarray(), conv_matrix_ref)
+
+
+@pytest.mark.parametrize(
+    "image_shape, kernel_size",
+    [((10, 10), 3), ((12, 16), 7), ((20, 20), 4)]
+)
+def test_build_convolution_operator(image_shape, kernel_size):
+    rng = np.random.default_rng(18)
+    kernel = rng.random((kernel_size, kernel_size))
+    vector = rng.random(image_shape[0] * image_shape[1])
+    conv_matrix = build_convolution_matrix(kernel, image_shape)
+    conv_operator = build_convolution_operator(kernel, image_shape)
+    npt.assert_allclose(conv_operator.matvec(vector), conv_matrix.dot(vector), rtol=1e-10)
+    npt.assert_allclose(conv_operator.rmatvec(vector), conv_matrix.T.dot(vector), rtol=1e-10)
+
+
+def test_first_derivative_matrix():
+    step_size = 0.5
+    D = _first_derivative_matrix(5, step_size).toarray()
+    # second-order one-sided differences on both ends, central differences elsewhere
+    D_ref = np.array([
+        [-3., 4., -1., 0., 0.],
+        [-1., 0., 1., 0., 0.],
+        [0., -1., 0., 1., 0.],
+        [0., 0., -1., 0., 1.],
+        [0., 0., 1., -4., 3.],
+    ]) / (2. * step_size)
+    npt.assert_allclose(D, D_ref, rtol=1e-12)
+
+
+@pytest.mark.parametrize("shape", [(6, 9), (8, 5), (7, 7)])
+def test_gradient_matrices(shape):
+    rng = np.random.default_rng(18)
+    step_size = 0.08
+    array = rng.random(shape)
+    D_x, D_y = _gradient_matrices(*shape, step_size)
+    assert D_x.shape == D_y.shape == (array.size, array.size)
+    grad_y, grad_x = np.gradient(array, step_size, edge_order=2)
+    npt.assert_allclose(D_x.dot(array.flatten()).reshape(shape), grad_x, rtol=1e-10)
+    npt.assert_allclose(D_y.dot(array.flatten()).reshape(shape), grad_y, rtol=1e-10)
+    # derivatives of a plane are exact, including on the boundaries
+    y, x = np.meshgrid(np.arange(shape[0]) * step_size, np.arange(shape[1]) * step_size, indexing='ij')
+    plane = 2. * x - 3. * y
+    npt.assert_allclose(D_x.dot(plane.flatten()), 2., rtol=1e-10)
+    npt.assert_allclose(D_y.dot(plane.flatten()), -3., rtol=1e-10)